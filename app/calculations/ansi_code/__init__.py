@@ -1,9 +1,26 @@
 from . import ansi_21
 from . import ansi_51
 from . import ansi_67
+from app.calculations import topology_manager
 
 AVAILABLE_ANSI_MODULES = {
     "21": ansi_21,
     "51": ansi_51,
     "67": ansi_67
 }
+
+def run_function_for_file(fname: str, dfs, config, global_tx_map: dict, code: str) -> list:
+    """Per-file worker of /ansi_21/run and /ansi_51/run: one ANSI function on the plans that enable it."""
+    if dfs is None: return []
+    # [+] [INFO] Per-file topology lives in ResolvedPlan views: the shared config is never copied nor mutated
+    plans = topology_manager.resolve_plans(topology_manager.overlay_plans(config), dfs)
+    module = AVAILABLE_ANSI_MODULES[code]
+    results = []
+    for plan in plans:
+        if code in plan.active_functions or f"ANSI {code}" in plan.active_functions:
+            try:
+                res = module.calculate(plan, config, dfs, global_tx_map)
+                results.append({"file": fname, "plan_id": plan.id, "status": "success", f"data_{code}": res})
+            except Exception as e:
+                results.append({"file": fname, "plan_id": plan.id, "status": "error", "error": str(e)})
+    return results
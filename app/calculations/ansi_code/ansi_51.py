@@ -1,9 +1,8 @@
 from app.schemas.protection import ProtectionPlan, GlobalSettings, ProjectConfig
-from app.calculations import db_converter, topology_manager
+from app.calculations import topology_manager, workspace, batch_engine
 from app.calculations.ansi_code import common
 import pandas as pd
 import io
-import copy
 from typing import List, Dict, Any
 import traceback
 import re
@@ -154,29 +153,34 @@ def calculate(plan: ProtectionPlan, full_config: ProjectConfig, dfs_dict: dict,
     }
 
 def run_batch_logic(config: ProjectConfig, files: Dict[str, bytes]) -> List[dict]:
-    global_tx_map = common.build_global_transformer_map(files)
+    # [+] [INFO] One WorkspaceContext per batch: each file is parsed once for the tx map AND the calculations
+    with workspace.WorkspaceContext(files, tables=common.WORKSPACE_TABLES) as ctx:
+        global_tx_map = common.build_global_transformer_map(ctx)
+        # [+] [INFO] Files are dispatched to the process pool (results keep the file order)
+        return batch_engine.run_per_file(ctx, common.is_supported_protection, process_file, config, global_tx_map,
+                                         tables=common.REQUIRED_TABLES)
+
+def process_file(filename: str, dfs, config: ProjectConfig, global_tx_map: dict) -> List[dict]:
+    """Topology resolution + ANSI 51 for every plan of one file."""
+    if dfs is None: return []
     results = []
-    
-    for filename, content in files.items():
-        if not common.is_supported_protection(filename): continue
-        dfs = db_converter.extract_data_from_db(content)
-        if not dfs: continue
-        file_config = copy.deepcopy(config)
-        try: topology_manager.resolve_all(file_config, dfs)
-        except Exception as e: print(f"Topology Error: {e}")
-
-        for plan in file_config.plans:
-            try:
-                res = calculate(plan, file_config, dfs, global_tx_map)
-                if res.get("status", "").startswith("error"): results.append(res); continue
-                ds = res.get("common_data", {})
-                if ds.get("kVnom_busfrom", 0) == 0 and ds.get("kVnom", 0) == 0: continue 
-                
-                res["plan_id"] = plan.id; res["plan_type"] = plan.type; res["source_file"] = filename
-                results.append(res)
-            except Exception as e:
-                traceback.print_exc()
-                results.append({"plan_id": plan.id, "source_file": filename, "status": "CRASH", "comments": [f"Error: {str(e)}"]})
+    # [+] [INFO] Per-file topology lives in ResolvedPlan views: the shared config is never copied nor mutated
+    plans = topology_manager.overlay_plans(config)
+    try: topology_manager.resolve_plans(plans, dfs)
+    except Exception as e: print(f"Topology Error: {e}")
+
+    for plan in plans:
+        try:
+            res = calculate(plan, config, dfs, global_tx_map)
+            if res.get("status", "").startswith("error"): results.append(res); continue
+            ds = res.get("common_data", {})
+            if ds.get("kVnom_busfrom", 0) == 0 and ds.get("kVnom", 0) == 0: continue 
+            
+            res["plan_id"] = plan.id; res["plan_type"] = plan.type; res["source_file"] = filename
+            results.append(res)
+        except Exception as e:
+            traceback.print_exc()
+            results.append({"plan_id": plan.id, "source_file": filename, "status": "CRASH", "comments": [f"Error: {str(e)}"]})
     return results
 
 def generate_excel(results: List[dict]) -> bytes:
@@ -1,61 +1,143 @@
 
 import pandas as pd
+import numpy as np
 import math
 import re
 from typing import Dict, Any, Optional
 from app.schemas.protection import ProtectionPlan, ProjectConfig
-from app.calculations import db_converter
+from app.calculations import db_converter, topology_manager, workspace, numeric_utils, parse_cache
+
+# [+] [INFO] Table declarations (whitelist + column projection for db_converter)
+BUS_TABLES = ["SCIECLGSUM1", "SC_SUM_1"]
+TRANSFORMER_TABLES = {t: ["ID", "MVA", "MaxMVA", "PrimkV", "Min%Tap", "Step%Tap"] for t in ["IXFMR2", "TRANSFORMER"]}
+# Everything an ANSI calculation needs for one file: short-circuit results + topology resolution
+REQUIRED_TABLES = db_converter.merge_table_specs(BUS_TABLES, topology_manager.REQUIRED_TABLES)
+# Tables opened by a protection WorkspaceContext (transformer map + per-file calculations)
+WORKSPACE_TABLES = db_converter.merge_table_specs(REQUIRED_TABLES, TRANSFORMER_TABLES)
 
 def is_supported_protection(fname: str) -> bool:
     e = fname.lower()
     return e.endswith('.si2s') or e.endswith('.mdb')
 
+class BusIndex:
+    """
+    Short-circuit results of one table set (SCIECLGSUM1 / SC_SUM_1), indexed by normalized FaultedBus.
+    Built once per file (see get_bus_index), then each lookup is a dict access.
+    """
+    def __init__(self, dfs_dict):
+        self.df = None
+        self.positions = {}
+        self.records = {}
+        for k in dfs_dict.keys():
+            if k.lower() in ["scieclgsum1", "sc_sum_1"]:
+                self.df = dfs_dict[k]
+                break
+        if self.df is None: return
+        try:
+            col_bus = next((c for c in self.df.columns if c.lower() == 'faultedbus'), None)
+            if not col_bus: return
+            keys = self.df[col_bus].astype(str).str.strip().str.upper()
+            for pos, key in enumerate(keys.tolist()):
+                # [decision:logic] First row wins, missing values never match (same as the former boolean mask)
+                if isinstance(key, str) and key not in self.positions: self.positions[key] = pos
+        except: self.positions = {}
+
+    def get(self, bus_name) -> Optional[dict]:
+        pos = self.positions.get(str(bus_name).strip().upper())
+        if pos is None: return None
+        if pos not in self.records:
+            try:
+                row = self.df.iloc[pos]
+                self.records[pos] = row.where(pd.notnull(row), None).to_dict()
+            except: return None
+        return dict(self.records[pos])
+
+def get_bus_index(dfs_dict) -> BusIndex:
+    # LazyTables (one file) and TableDict (merged files) keep the index for the rest of the request
+    memo = getattr(dfs_dict, "memo", None)
+    if memo is not None: return memo("bus_index", lambda: BusIndex(dfs_dict))
+    return BusIndex(dfs_dict)
+
 def find_bus_data(dfs_dict: dict, bus_name: str) -> dict:
     if not bus_name: return None
-    target_df = None
-    for k in dfs_dict.keys():
-        if k.lower() in ["scieclgsum1", "sc_sum_1"]:
-            target_df = dfs_dict[k]
+    return get_bus_index(dfs_dict).get(bus_name)
+
+def build_global_transformer_map(files) -> Dict[str, Dict]:
+    """`files` is a WorkspaceContext (tables shared with the rest of the request) or a {filename: bytes} dict."""
+    ctx, owned = workspace.as_context(files, tables=TRANSFORMER_TABLES)
+    try: return _build_global_transformer_map(ctx)
+    finally:
+        if owned: ctx.close()
+
+# [+] [INFO] Bump when the aggregation rules change: the map is cached per workspace fingerprint
+TX_MAP_RESULT = "transformer-map-v1"
+TX_FIELDS = ["MVA", "MaxMVA", "PrimkV", "Min%Tap", "Step%Tap"]
+
+def _transformer_rows(dfs) -> Optional[pd.DataFrame]:
+    """IXFMR2 / TRANSFORMER rows of one file: ID + numeric fields, each masked where it was not read."""
+    xfmr_table = None
+    for k in dfs.keys():
+        if k.upper() in ["IXFMR2", "TRANSFORMER"]:
+            xfmr_table = dfs[k]
             break
-    if target_df is None: return None
-    try:
-        col_bus = next((c for c in target_df.columns if c.lower() == 'faultedbus'), None)
-        if not col_bus: return None
-        row = target_df[target_df[col_bus].astype(str).str.strip().str.upper() == str(bus_name).strip().upper()]
-        if row.empty: return None
-        return row.iloc[0].where(pd.notnull(row.iloc[0]), None).to_dict()
-    except: return None
-
-def build_global_transformer_map(files: Dict[str, bytes]) -> Dict[str, Dict]:
-    global_map = {}
-    for fname, content in files.items():
-        if not is_supported_protection(fname): continue
-        dfs = db_converter.extract_data_from_db(content)
-        if not dfs: continue
-        xfmr_table = None
-        for k in dfs.keys():
-            if k.upper() in ["IXFMR2", "TRANSFORMER"]:
-                xfmr_table = dfs[k]
-                break
-        if xfmr_table is not None and not xfmr_table.empty:
-            for _, row in xfmr_table.iterrows():
-                try:
-                    tid = str(row.get("ID", "")).strip()
-                    if not tid: continue
-                    if tid not in global_map:
-                        global_map[tid] = {"MVA": 0.0, "MaxMVA": 0.0, "MinTap": 0.0, "StepTap": 0.0, "PrimkV": 0.0}
-                    val_mva = float(row.get("MVA", 0) or 0)
-                    if val_mva > global_map[tid]["MVA"]: global_map[tid]["MVA"] = val_mva
-                    val_max = float(row.get("MaxMVA", 0) or 0)
-                    if val_max > global_map[tid]["MaxMVA"]: global_map[tid]["MaxMVA"] = val_max
-                    val_kv = float(row.get("PrimkV", 0) or 0)
-                    if val_kv > global_map[tid]["PrimkV"]: global_map[tid]["PrimkV"] = val_kv
-                    val_min = float(row.get("Min%Tap", 0) or 0)
-                    curr_min = global_map[tid]["MinTap"]
-                    if abs(val_min) > abs(curr_min): global_map[tid]["MinTap"] = val_min
-                    val_step = float(row.get("Step%Tap", 0) or 0)
-                    if val_step != 0 and global_map[tid]["StepTap"] == 0: global_map[tid]["StepTap"] = val_step
-                except: continue
+    if xfmr_table is None or xfmr_table.empty: return None
+
+    # Rows as iterrows() exposed them (common dtype of the file's table)
+    values = xfmr_table.to_numpy()
+    columns = list(xfmr_table.columns)
+    n = len(values)
+    if "ID" not in columns: return None
+    rows = pd.DataFrame({"ID": pd.Series(values[:, columns.index("ID")], dtype=object).map(str).str.strip()})
+    # [decision:logic] Fields are read in this order and an unparsable one hides the rest of the row
+    readable = np.ones(n, dtype=bool)
+    for key in TX_FIELDS:
+        if key in columns: vals, ok = numeric_utils.to_float(values[:, columns.index(key)], falsy_as_zero=True)
+        else: vals, ok = np.zeros(n), np.ones(n, dtype=bool) # row.get(key, 0)
+        readable &= ok
+        rows[key] = np.where(readable, vals, np.nan)
+        rows[f"{key}_ok"] = readable.copy()
+    return rows[rows["ID"] != ""]
+
+def _aggregate_transformers(frames) -> Dict[str, Dict]:
+    """
+    groupby ID over every file: max for MVA / MaxMVA / PrimkV (floor 0), largest |Min%Tap| (first one on ties),
+    first non-zero Step%Tap. NaN never wins a max, but counts as a non-zero step (historical rule).
+    """
+    if not frames: return {}
+    rows = pd.concat(frames, ignore_index=True)
+    grouped = rows.groupby("ID", sort=False)
+    result = pd.DataFrame(index=grouped.size().index)
+    for key, out in [("MVA", "MVA"), ("MaxMVA", "MaxMVA"), ("PrimkV", "PrimkV")]:
+        best = grouped[key].max()
+        result[out] = best.where(best > 0, 0.0)
+
+    abs_tap = rows["Min%Tap"].abs()
+    max_abs = abs_tap.groupby(rows["ID"], sort=False).transform("max")
+    winners = rows[(abs_tap == max_abs) & (max_abs > 0)].drop_duplicates("ID")
+    result["MinTap"] = winners.set_index("ID")["Min%Tap"].reindex(result.index).fillna(0.0)
+
+    nz = rows["Step%Tap_ok"] & (rows["Step%Tap"] != 0)
+    first_nz = rows[nz].drop_duplicates("ID").set_index("ID")["Step%Tap"]
+    result["StepTap"] = 0.0
+    result.loc[first_nz.index, "StepTap"] = first_nz
+
+    return {
+        tid: {"MVA": float(r.MVA), "MaxMVA": float(r.MaxMVA), "MinTap": float(r.MinTap),
+              "StepTap": float(r.StepTap), "PrimkV": float(r.PrimkV)}
+        for tid, r in zip(result.index, result.itertuples(index=False))
+    }
+
+def _build_global_transformer_map(ctx) -> Dict[str, Dict]:
+    tables = list(ctx.iter_tables(is_supported_protection))
+    # [+] [INFO] Workspace fingerprint = content digests in file order: /export right after /run is a cache hit
+    fingerprint = None
+    if all(getattr(dfs, "digest", None) for _, dfs in tables):
+        fingerprint = parse_cache.content_digest("\n".join(dfs.digest for _, dfs in tables).encode())
+        cached = parse_cache.load_result(fingerprint, TX_MAP_RESULT)
+        if cached is not None: return cached
+
+    global_map = _aggregate_transformers([f for f in (_transformer_rows(dfs) for _, dfs in tables) if f is not None])
+    if fingerprint: parse_cache.store_result(fingerprint, TX_MAP_RESULT, global_map)
     return global_map
 
 def calc_In(mva, kv):
@@ -74,6 +156,40 @@ def parse_ct_primary(ct_string: str) -> float:
     if match: return float(match.group(1))
     return 0.0
 
+def hv_transformer_sum(full_config: ProjectConfig, global_tx_map: dict):
+    """
+    Sum of the HV transformers (PrimkV > 50 kV) seen by an INCOMER / FEEDER plan.
+    Identical for every such plan of a run: computed once per (config, transformer map).
+    Returns (total_in_prim, total_inrush_50, total_inrush_80, {"data_<tid>": {...}}).
+    """
+    key = ("hv_sum", id(global_tx_map))
+    cached = full_config._derived.get(key)
+    if cached is not None and cached[0] is global_tx_map: return cached[1]
+
+    total_in_prim = 0.0
+    total_inrush_50 = 0.0
+    total_inrush_80 = 0.0
+    per_tx = {}
+    for tid, tdata in global_tx_map.items():
+        prim_kv = float(tdata.get("PrimkV", 0))
+        if prim_kv > 50.0:
+            mva = tdata.get("MVA", 0)
+            i_n_tx = calc_In(mva, prim_kv)
+            tx_conf = full_config.get_transformer(tid)
+            ratio = tx_conf.ratio_iencl if tx_conf else 8.0 
+            tau = tx_conf.tau_ms if tx_conf else 100.0
+            inrush_50 = calc_inrush_rms_decay(i_n_tx, ratio, tau, 0.05)
+            inrush_80 = calc_inrush_rms_decay(i_n_tx, ratio, tau, 0.08)
+            total_in_prim += i_n_tx
+            total_inrush_50 += inrush_50
+            total_inrush_80 += inrush_80
+            per_tx[f"data_{tid}"] = {"In_prim": round(i_n_tx, 2), "MVA": mva, "Inrush_Ratio": ratio, 
+                                     "inrush_50ms": round(inrush_50, 2), "inrush_80ms": round(inrush_80, 2)}
+    result = (total_in_prim, total_inrush_50, total_inrush_80, per_tx)
+    # [!] The map itself is kept in the entry: its id() cannot be reused while the entry lives
+    full_config._derived[key] = (global_tx_map, result)
+    return result
+
 def get_electrical_parameters(plan: ProtectionPlan, full_config: ProjectConfig, dfs_dict: dict, global_tx_map: dict) -> Dict[str, Any]:
     bus_amont = plan.bus_from
     bus_aval = plan.bus_to
@@ -104,7 +220,7 @@ def get_electrical_parameters(plan: ProtectionPlan, full_config: ProjectConfig,
         maxmva_tx = float(tx_data_etap.get("MaxMVA", 0))
         min_tap = float(tx_data_etap.get("MinTap", 0)) 
         step_tap = float(tx_data_etap.get("StepTap", 0))
-        tx_user_config = next((t for t in full_config.transformers if t.name == tx_id), None)
+        tx_user_config = full_config.get_transformer(tx_id)
         ratio_iencl = tx_user_config.ratio_iencl if tx_user_config else 8.0
         tau_ms = tx_user_config.tau_ms if tx_user_config else 100.0
         
@@ -159,29 +275,12 @@ def get_electrical_parameters(plan: ProtectionPlan, full_config: ProjectConfig,
     else:
         ct_in = parse_ct_primary(plan.ct_primary)
         link_id = plan.related_source
-        link_data = next((l for l in full_config.links_data if l.id == link_id), None)
+        link_data = full_config.get_link(link_id)
         link_info = {"Link_ID": link_data.id, "Lenght_link": f"{link_data.length_km} km", 
                      "Impedances_link": {"Zd": link_data.impedance_zd, "Z0": link_data.impedance_z0}} if link_data else {"Link_ID": "Not Found"}
 
-        total_in_prim = 0.0
-        total_inrush_50 = 0.0
-        total_inrush_80 = 0.0
-        
-        for tid, tdata in global_tx_map.items():
-            prim_kv = float(tdata.get("PrimkV", 0))
-            if prim_kv > 50.0:
-                mva = tdata.get("MVA", 0)
-                i_n_tx = calc_In(mva, prim_kv)
-                tx_conf = next((t for t in full_config.transformers if t.name == tid), None)
-                ratio = tx_conf.ratio_iencl if tx_conf else 8.0 
-                tau = tx_conf.tau_ms if tx_conf else 100.0
-                inrush_50 = calc_inrush_rms_decay(i_n_tx, ratio, tau, 0.05)
-                inrush_80 = calc_inrush_rms_decay(i_n_tx, ratio, tau, 0.08)
-                total_in_prim += i_n_tx
-                total_inrush_50 += inrush_50
-                total_inrush_80 += inrush_80
-                data_settings[f"data_{tid}"] = {"In_prim": round(i_n_tx, 2), "MVA": mva, "Inrush_Ratio": ratio, 
-                                                "inrush_50ms": round(inrush_50, 2), "inrush_80ms": round(inrush_80, 2)}
+        total_in_prim, total_inrush_50, total_inrush_80, per_tx = hv_transformer_sum(full_config, global_tx_map)
+        for key, tx_row in per_tx.items(): data_settings[key] = dict(tx_row)
         
         if total_in_prim == 0:
             total_in_prim = ct_in
@@ -197,3 +296,18 @@ def get_electrical_parameters(plan: ProtectionPlan, full_config: ProjectConfig,
             "Ik2min_sec_ref": from_ikLL, "Ik3max_sec_ref": from_ik3ph
         })
     return data_settings
+
+def file_parameters(fname: str, dfs, config: ProjectConfig, global_tx_map: dict, include_data: bool = False) -> list:
+    """Per-file worker of /common/run: topology resolution + electrical parameters of every plan."""
+    if dfs is None: return []
+    plans = topology_manager.resolve_plans(topology_manager.overlay_plans(config), dfs)
+    results = []
+    for plan in plans:
+        try:
+            data = get_electrical_parameters(plan, config, dfs, global_tx_map)
+            if not include_data:
+                data.pop("raw_data_from", None); data.pop("raw_data_to", None)
+            results.append({"plan_id": plan.id, "file": fname, "common_data": data})
+        except Exception as e:
+            results.append({"plan_id": plan.id, "file": fname, "error": str(e)})
+    return results
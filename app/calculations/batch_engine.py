@@ -0,0 +1,158 @@
+import os
+import threading
+from collections import deque
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+from app.calculations import db_converter
+
+# --- CONFIGURATION ---
+# BATCH_WORKERS : size of the shared process pool (default: one per usable core, 1 = always serial)
+# BATCH_SERIAL_THRESHOLD : below this number of files, dispatching costs more than it saves
+# BATCH_MIN_MB : below this total input size too (small files parse in a few ms, a spawned worker
+#                re-imports pandas and re-opens the file)
+# BATCH_WARM_UP : 1 = start the pool with the app (off by default: every uvicorn worker would spawn
+#                 BATCH_WORKERS processes, the pool otherwise starts with the first batch that needs it)
+def _usable_cpus() -> int:
+    # Cores this process may run on (container cpusets), not the cores of the host
+    if hasattr(os, "sched_getaffinity"): return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "0")) or _usable_cpus()
+BATCH_SERIAL_THRESHOLD = int(os.getenv("BATCH_SERIAL_THRESHOLD", "4"))
+BATCH_MIN_BYTES = int(float(os.getenv("BATCH_MIN_MB", "8")) * 1024 * 1024)
+BATCH_WARM_UP = os.getenv("BATCH_WARM_UP", "0") == "1"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # [decision:logic] 'spawn' : the API process runs threads (uvicorn, threadpool), fork is not safe.
+            _executor = ProcessPoolExecutor(max_workers=BATCH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None: _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def _warm():
+    return os.getpid()
+
+def warm_up():
+    """Starts the pool workers ahead of the first batch (spawn + pandas import take seconds). No-op if serial or BATCH_WARM_UP is off."""
+    if not BATCH_WARM_UP or BATCH_WORKERS < 2: return
+    executor = _get_executor()
+    for _ in range(BATCH_WORKERS): executor.submit(_warm)
+
+def use_pool(n_items: int, max_workers: Optional[int] = None, total_bytes: Optional[int] = None) -> bool:
+    workers = BATCH_WORKERS if max_workers is None else min(max_workers, BATCH_WORKERS)
+    if total_bytes is not None and total_bytes < BATCH_MIN_BYTES: return False
+    return workers > 1 and n_items >= BATCH_SERIAL_THRESHOLD
+
+def map_ordered(func: Callable, items: Iterable, max_workers: Optional[int] = None,
+                serial_func: Optional[Callable] = None, total_bytes: Optional[int] = None) -> List:
+    """
+    Runs func(item) for every item and returns the results in input order (deterministic).
+    Uses the shared process pool for large batches (`total_bytes`: input size, when known);
+    `func` and the items must be picklable.
+    Small batches run in-process with `serial_func` (defaults to `func`), which may use
+    objects that cannot cross a process boundary (e.g. the request WorkspaceContext).
+    """
+    items = list(items)
+    serial = serial_func or func
+    if not use_pool(len(items), max_workers, total_bytes):
+        return [serial(item) for item in items]
+    try:
+        return list(_get_executor().map(func, items))
+    except BrokenProcessPool as e:
+        # A worker died (OOM, segfault in a driver...): rebuild the pool next time, finish serially now.
+        print(f"[Batch] Process pool broken ({e}), falling back to serial execution.")
+        _reset_executor()
+        return [serial(item) for item in items]
+
+def imap_unordered(func: Callable, items: Iterable, max_in_flight: Optional[int] = None,
+                   serial_func: Optional[Callable] = None, total_bytes: Optional[int] = None) -> Iterator:
+    """
+    Yields func(item) as soon as each one finishes (completion order, not input order).
+    At most `max_in_flight` items (default: BATCH_WORKERS) are submitted to the pool at a time, so the
+    results waiting to be consumed are bounded too. Closing the generator cancels what is not started.
+    """
+    todo = deque(items)
+    serial = serial_func or func
+    in_flight = BATCH_WORKERS if max_in_flight is None else max_in_flight
+    if not use_pool(len(todo), in_flight, total_bytes):
+        for item in todo: yield serial(item)
+        return
+    pending = {}
+    try:
+        try:
+            while todo or pending:
+                while todo and len(pending) < in_flight:
+                    item = todo.popleft()
+                    try: pending[_get_executor().submit(func, item)] = item
+                    except BrokenProcessPool: todo.appendleft(item); raise
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    try: result = future.result()
+                    except BrokenProcessPool: todo.appendleft(item); raise
+                    yield result
+        except BrokenProcessPool as e:
+            print(f"[Batch] Process pool broken ({e}), falling back to serial execution.")
+            _reset_executor()
+            todo.extendleft(reversed(list(pending.values())))
+            pending = {}
+            while todo: yield serial(todo.popleft())
+    finally:
+        for future in pending: future.cancel()
+
+# --- PER-FILE DISPATCH ---
+
+def _file_task(task):
+    """Process-pool entry point: opens the file inside the worker, then calls the handler."""
+    handler, fname, content, tables, args = task
+    dfs = db_converter.open_tables(content, tables=tables)
+    try: return handler(fname, dfs, *args)
+    finally:
+        if dfs is not None: dfs.close()
+
+def run_per_file(ctx, predicate: Callable[[str], bool], handler: Callable, *args,
+                 tables=None, max_workers: Optional[int] = None) -> List:
+    """
+    Runs handler(fname, dfs, *args) -> list for every file of the WorkspaceContext accepted by
+    `predicate` and concatenates the rows in file order. `handler` must be a module-level function.
+    Serial runs reuse the tables already opened by the context; pool workers re-open the file
+    (served by the parse cache when it is warm).
+    """
+    names = [f for f in ctx.files if predicate(f)]
+    tasks = [(handler, f, ctx.files[f], tables or ctx.tables_spec, args) for f in names]
+    per_file = map_ordered(_file_task, tasks, max_workers=max_workers,
+                           serial_func=lambda t: handler(t[1], ctx.get_tables(t[1]), *args),
+                           total_bytes=sum(len(ctx.files[f] or b"") for f in names))
+    return [row for rows in per_file for row in rows]
+
+# --- STREAMED EXPORT ---
+
+def _export_task(task):
+    fname, path, fmt = task
+    try: return fname, db_converter.export_file(path, fmt)
+    except Exception as e:
+        print(f"Error converting {fname}: {e}")
+        return fname, None
+
+def export_files(files: List[Tuple[str, str]], fmt: str, max_in_flight: Optional[int] = None) -> Iterator[Tuple[str, bytes]]:
+    """
+    Converts (filename, path) pairs to xlsx / json in the shared pool and yields (filename, exported bytes)
+    as each conversion finishes. Files that cannot be converted are skipped.
+    Memory holds at most `max_in_flight` exported files, whatever the number of files.
+    """
+    tasks = [(fname, path, fmt) for fname, path in files]
+    total_bytes = sum(os.path.getsize(path) for _, path in files)
+    for fname, data in imap_unordered(_export_task, tasks, max_in_flight=max_in_flight, total_bytes=total_bytes):
+        if data is not None: yield fname, data
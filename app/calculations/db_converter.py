@@ -3,26 +3,251 @@ import pandas as pd
 import tempfile
 import os
 import io
+import json
+import threading
+import urllib.parse
+from collections.abc import Mapping
+from app.calculations import parse_cache
 
-def extract_data_from_db(file_content: bytes):
-    """Lit SI2S, LF1S, MDB via SQLite"""
+# --- INSTRUMENTATION ---
+# Compteurs des chemins de chargement utilisés (exposés via /debug/db-loader).
+# cache : table servie par le parse_cache | uri : fichier du workspace ouvert en lecture seule
+# deserialize : octets chargés en mémoire | tempfile : ancien chemin (fallback)
+LOAD_STATS = {"cache": 0, "uri": 0, "deserialize": 0, "tempfile": 0, "failed": 0}
+_last_load = {"mode": None}
+_stats_lock = threading.Lock()
+
+# sqlite3.Connection.deserialize n'existe qu'à partir de Python 3.11
+HAS_DESERIALIZE = hasattr(sqlite3.Connection, "deserialize")
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+def _record_load(mode: str):
+    with _stats_lock:
+        LOAD_STATS[mode] = LOAD_STATS.get(mode, 0) + 1
+        _last_load["mode"] = mode
+
+def get_load_stats() -> dict:
+    with _stats_lock:
+        return {"counters": dict(LOAD_STATS), "last_mode": _last_load["mode"], "deserialize_available": HAS_DESERIALIZE}
+
+def _list_tables(conn) -> list:
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+    return [row[0] for row in cursor.fetchall()]
+
+def _read_header(file_content: bytes, source_path: str) -> bytes:
+    if file_content is not None: return bytes(file_content[:16])
+    with open(source_path, "rb") as f: return f.read(16)
+
+def open_database(file_content: bytes = None, source_path: str = None):
+    """
+    Ouvre la base SQLite en évitant le fichier temporaire.
+    Ordre : fichier du workspace en lecture seule (URI immutable) -> deserialize en mémoire -> tempfile.
+    Retourne (conn, mode, tmp_path) ou (None, None, None) si ce n'est pas une base SQLite.
+    """
+    try:
+        if _read_header(file_content, source_path) != SQLITE_HEADER: return None, None, None
+    except OSError: return None, None, None
+
+    if source_path and os.path.isfile(source_path):
+        conn = None
+        try:
+            uri = f"file:{urllib.parse.quote(os.path.abspath(source_path))}?mode=ro&immutable=1"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            _list_tables(conn)
+            return conn, "uri", None
+        except sqlite3.Error:
+            if conn is not None: conn.close()
+
+    if file_content is not None and HAS_DESERIALIZE:
+        conn = None
+        try:
+            conn = sqlite3.connect(":memory:", check_same_thread=False)
+            conn.deserialize(file_content)
+            _list_tables(conn)
+            return conn, "deserialize", None
+        except sqlite3.Error:
+            # [?] [THOUGHT] Les bases en mode WAL ne se désérialisent pas : on retombe sur le tempfile.
+            if conn is not None: conn.close()
+
+    if file_content is None:
+        with open(source_path, "rb") as f: file_content = f.read()
     with tempfile.NamedTemporaryFile(delete=False, suffix=".sqlite") as tmp:
         tmp.write(file_content)
         tmp_path = tmp.name
-    data_frames = {}
     try:
-        conn = sqlite3.connect(tmp_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = [row[0] for row in cursor.fetchall()]
-        for table in tables:
-            try: data_frames[table] = pd.read_sql_query(f'SELECT * FROM "{table}"', conn)
-            except: pass
-        conn.close()
-    except: return None
+        conn = sqlite3.connect(tmp_path, check_same_thread=False)
+    except sqlite3.Error:
+        os.remove(tmp_path)
+        raise
+    return conn, "tempfile", tmp_path
+
+def close_database(conn, tmp_path: str = None):
+    try:
+        if conn is not None: conn.close()
     finally:
-        if os.path.exists(tmp_path): os.remove(tmp_path)
-    return data_frames
+        if tmp_path and os.path.exists(tmp_path): os.remove(tmp_path)
+
+def _spec_items(tables):
+    if isinstance(tables, dict): return tables.items()
+    return ((name, None) for name in tables)
+
+def merge_table_specs(*specs) -> dict:
+    """
+    Union de déclarations de tables : liste de noms ou {nom: None | [colonnes]}.
+    Clés en majuscules (ETAP n'est pas constant sur la casse) ; une projection None l'emporte.
+    """
+    merged = {}
+    for spec in specs:
+        for name, cols in _spec_items(spec):
+            key = str(name).upper()
+            cols = list(cols) if cols is not None else None
+            if key not in merged: merged[key] = cols
+            elif merged[key] is None or cols is None: merged[key] = None
+            else: merged[key] += [c for c in cols if c not in merged[key]]
+    return merged
+
+class LazyTables(Mapping):
+    """
+    Mapping {table: DataFrame} d'une base ETAP qui ne lit une table qu'au premier accès.
+    Les tables sont servies par le parse_cache si possible, sinon lues dans SQLite
+    (puis mises en cache). Les tables hors whitelist ne sont jamais lues.
+    """
+    def __init__(self, file_content: bytes = None, source_path: str = None, tables=None, digest: str = None):
+        self._content = file_content
+        self._path = source_path
+        self._spec = merge_table_specs(tables) if tables is not None else None
+        if digest: self.digest = digest
+        elif file_content is not None: self.digest = parse_cache.content_digest(file_content)
+        else: self.digest = parse_cache.file_digest(source_path)
+        self._frames = {}
+        self._memo = {}
+        self._conn = None; self._mode = None; self._tmp_path = None
+        self._stored = False
+        self._lock = threading.RLock()
+
+        names = parse_cache.load_table_names(self.digest)
+        if names is None:
+            conn = self._connect()
+            if conn is None: raise ValueError("Not a SQLite database")
+            names = _list_tables(conn)
+            parse_cache.store_table_names(self.digest, names)
+        self._names = [n for n in names if self._spec is None or n.upper() in self._spec]
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn, self._mode, self._tmp_path = open_database(self._content, self._path)
+            if self._conn is not None: _record_load(self._mode)
+        return self._conn
+
+    def _materialize(self, name: str):
+        cols = self._spec.get(name.upper()) if self._spec else None
+        df = parse_cache.load_table(self.digest, name, cols)
+        if df is not None:
+            _record_load("cache")
+            return df
+        conn = self._connect()
+        if conn is None: raise ValueError("Database unavailable")
+        if cols is None:
+            df = pd.read_sql_query(f'SELECT * FROM "{name}"', conn)
+            parse_cache.store_table(self.digest, name, df)
+            self._stored = True
+            return df
+        # [decision:logic] Projection : seules les colonnes demandées sont lues (pas de mise en cache partielle)
+        available = [row[1] for row in conn.execute(f'PRAGMA table_info("{name}")').fetchall()]
+        selected = parse_cache.match_columns(available, cols)
+        if not selected: return pd.DataFrame()
+        col_sql = ", ".join('"' + c.replace('"', '""') + '"' for c in selected)
+        return pd.read_sql_query(f'SELECT {col_sql} FROM "{name}"', conn)
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name in self._frames: return self._frames[name]
+            if name not in self._names: raise KeyError(name)
+            try:
+                df = self._materialize(name)
+            except Exception as e:
+                # Même comportement que l'ancien extract : une table illisible est ignorée.
+                print(f"[DB] Table {name} illisible : {e}")
+                self._names.remove(name)
+                raise KeyError(name)
+            self._frames[name] = df
+            return df
+
+    def __iter__(self): return iter(list(self._names))
+    def __len__(self): return len(self._names)
+    def __contains__(self, name): return name in self._names
+
+    def items(self):
+        for name in list(self._names):
+            try: yield name, self[name]
+            except KeyError: continue
+
+    def values(self):
+        for _, df in self.items(): yield df
+
+    def memo(self, key: str, factory):
+        """Structure dérivée des tables (index...) construite une seule fois pour ce fichier."""
+        with self._lock:
+            if key not in self._memo: self._memo[key] = factory()
+            return self._memo[key]
+
+    def close(self, enforce_budget: bool = True):
+        with self._lock:
+            if self._conn is not None or self._tmp_path:
+                close_database(self._conn, self._tmp_path)
+            self._conn = None; self._tmp_path = None
+            self._content = None
+            if self._stored and enforce_budget:
+                self._stored = False
+                parse_cache.enforce_budget()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+    def __del__(self):
+        try: self.close(enforce_budget=False)
+        except Exception: pass
+
+class TableDict(dict):
+    """dict {table: DataFrame} classique (tables fusionnées...) avec le même memo() que LazyTables."""
+    def memo(self, key: str, factory):
+        cache = self.__dict__.setdefault("_memo", {})
+        if key not in cache: cache[key] = factory()
+        return cache[key]
+
+def open_tables(file_content: bytes = None, source_path: str = None, tables=None):
+    """
+    Ouvre une base ETAP en mode paresseux. `tables` = whitelist optionnelle
+    (voir REQUIRED_TABLES des calculateurs). Retourne None si le fichier est illisible.
+    """
+    if file_content is None and not source_path: return None
+    try:
+        return LazyTables(file_content, source_path, tables)
+    except Exception:
+        _record_load("failed")
+        return None
+
+def extract_data_from_db(file_content: bytes = None, source_path: str = None, tables=None):
+    """
+    Lit SI2S, LF1S, MDB via SQLite (résultat mis en cache par SHA-256 du contenu).
+    `source_path` permet d'ouvrir directement le fichier du workspace sans recopier les octets.
+    `tables` limite la lecture aux tables (et colonnes) demandées.
+    """
+    lazy = open_tables(file_content, source_path, tables)
+    if lazy is None: return None
+    try: return dict(lazy.items())
+    finally: lazy.close()
+
+def warm_cache(source_path: str, tables) -> int:
+    """
+    Lit les tables `tables` (noms, les projections sont ignorées) d'un fichier et les range dans le parse_cache :
+    les analyses lancées juste après un upload ne repassent pas par SQLite. Retourne le nombre de tables lues.
+    """
+    if not parse_cache.is_enabled(): return 0
+    lazy = open_tables(source_path=source_path, tables=[name for name, _ in _spec_items(tables)])
+    if lazy is None: return 0
+    try: return sum(1 for _ in lazy.items())
+    finally: lazy.close()
 
 def generate_excel_bytes(data_frames: dict) -> io.BytesIO:
     output = io.BytesIO()
@@ -38,3 +263,16 @@ def generate_excel_bytes(data_frames: dict) -> io.BytesIO:
                 df.to_excel(writer, sheet_name=sheet_name, index=False)
     output.seek(0)
     return output
+
+def export_file(source_path: str, fmt: str):
+    """
+    Convertit un fichier du workspace en xlsx / json (octets du fichier exporté).
+    Retourne None si le fichier est illisible, vide ou le format inconnu.
+    """
+    dfs = extract_data_from_db(source_path=source_path)
+    if not dfs: return None
+    if fmt == "xlsx": return generate_excel_bytes(dfs).getvalue()
+    if fmt == "json":
+        d = {t: df.where(pd.notnull(df), None).to_dict(orient="records") for t, df in dfs.items()}
+        return json.dumps(d, default=str, indent=2).encode("utf-8")
+    return None
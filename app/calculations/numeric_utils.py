@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_numeric_dtype, is_extension_array_dtype
+
+# --- Column-level numeric normalization ---
+# [?] [THOUGHT] ETAP exports mix real numbers, text numbers and French decimal commas ("1,05").
+# The calculators used to convert one cell at a time inside try/except; these helpers convert a
+# whole column once and return a validity mask so the historical per-cell rules are preserved.
+
+def _cell(value, decimal_comma: bool, falsy_as_zero: bool) -> float:
+    """Reference per-cell rule (also the fallback for the rare cells the vectorized path rejects)."""
+    if falsy_as_zero: return float(value or 0)
+    text = str(value)
+    return float(text.replace(',', '.') if decimal_comma else text)
+
+def _cells(values, decimal_comma: bool, falsy_as_zero: bool):
+    out = np.full(len(values), np.nan); ok = np.zeros(len(values), dtype=bool)
+    for i, v in enumerate(values):
+        try: out[i] = _cell(v, decimal_comma, falsy_as_zero); ok[i] = True
+        except: pass
+    return out, ok
+
+def to_float(values, decimal_comma: bool = True, falsy_as_zero: bool = False):
+    """
+    Converts a column (Series / array) to float64 in one pass.
+      - decimal_comma=True  : same result as float(str(x).replace(',', '.'))   (loadflow fields)
+      - falsy_as_zero=True  : same result as float(x or 0)                      (transformer map)
+    Returns (values, ok): float64 array and bool array, ok=False where the per-cell rule raises.
+    Positions follow the input order (the index is ignored).
+    """
+    s = values if isinstance(values, pd.Series) else pd.Series(values)
+    n = len(s)
+    dtype = s.dtype
+
+    # 1. Native numeric columns: nothing to parse
+    if is_bool_dtype(dtype) and not is_extension_array_dtype(dtype):
+        # str(True) is not a number, float(True or 0) is
+        if falsy_as_zero: return s.to_numpy(dtype=np.float64), np.ones(n, dtype=bool)
+        return np.full(n, np.nan), np.zeros(n, dtype=bool)
+    if is_numeric_dtype(dtype) and not is_extension_array_dtype(dtype):
+        return s.to_numpy(dtype=np.float64), np.ones(n, dtype=bool)
+
+    # 2. Text / mixed columns
+    obj = s.to_numpy(dtype=object)
+    out = np.full(n, np.nan); ok = np.zeros(n, dtype=bool)
+    is_text = np.fromiter((isinstance(v, str) for v in obj), dtype=bool, count=n)
+
+    text_pos = np.flatnonzero(is_text)
+    if len(text_pos):
+        text = pd.Series(obj[text_pos], dtype=object)
+        if decimal_comma and not falsy_as_zero: text = text.str.replace(',', '.', regex=False)
+        parsed = pd.to_numeric(text, errors="coerce")
+        good = parsed.notna().to_numpy()
+        if good.any():
+            # [!] to_numeric is only the filter: its float parser is not always correctly rounded,
+            # the numpy object -> float64 cast uses float() and gives the exact historical values.
+            try:
+                out[text_pos[good]] = text.to_numpy(dtype=object)[good].astype(np.float64)
+                ok[text_pos[good]] = True
+            except (ValueError, TypeError):
+                good[:] = False
+        # Rejected cells ('nan', '', '1_000', real garbage...) go through the reference rule
+        rest = text_pos[~good]
+        if len(rest): out[rest], ok[rest] = _cells(obj[rest], decimal_comma, falsy_as_zero)
+
+    # Non-text cells of a mixed column (numbers, None, bool...)
+    other = np.flatnonzero(~is_text)
+    if len(other): out[other], ok[other] = _cells(obj[other], decimal_comma, falsy_as_zero)
+    return out, ok
@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+import pandas as pd
+
+# --- CONFIGURATION ---
+# [structure:storage] The cache lives outside STORAGE_ROOT (/app/storage): every folder there is
+# a project or a user workspace, anything else is reported (and deleted) as an orphan by storage_admin.
+CACHE_DIR = os.getenv("PARSE_CACHE_DIR", "/app/cache/parse")
+# Disk budget in MB. 0 disables the cache entirely.
+CACHE_MAX_MB = float(os.getenv("PARSE_CACHE_MAX_MB", "2048"))
+
+TABLES_INDEX = "tables.json"
+
+try:
+    import pyarrow.parquet
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+def content_digest(content: bytes) -> str:
+    """SHA-256 of the raw file bytes. Used as the cache key."""
+    return hashlib.sha256(content).hexdigest()
+
+def file_digest(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Same digest as content_digest, computed by streaming the file from disk."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""): h.update(chunk)
+    return h.hexdigest()
+
+# [+] [INFO] Digest of a workspace file memoized on its stat (path, size, mtime, inode): repeated lookups
+# on an unchanged file (e.g. diagram node details) neither read nor hash it again. Per process, bounded.
+_PATH_DIGESTS_MAX = 4096
+_path_digests = {}
+_path_digests_lock = threading.Lock()
+
+def path_digest(path: str) -> str:
+    """file_digest(path), served from the stat memo when the file did not change."""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns, st.st_ino)
+    with _path_digests_lock:
+        digest = _path_digests.get(key)
+    if digest: return digest
+    digest = file_digest(path)
+    with _path_digests_lock:
+        if len(_path_digests) >= _PATH_DIGESTS_MAX: _path_digests.clear()
+        _path_digests[key] = digest
+    return digest
+
+def is_enabled() -> bool:
+    return CACHE_MAX_MB > 0
+
+def _entry_dir(digest: str) -> str:
+    return os.path.join(CACHE_DIR, digest)
+
+def _table_stem(table_name: str) -> str:
+    # [decision:logic] ETAP table names are not always filesystem-safe, hash them.
+    return hashlib.sha1(table_name.encode("utf-8")).hexdigest()[:16]
+
+def match_columns(available, wanted) -> list:
+    """Columns of `available` requested in `wanted` (case and whitespace insensitive, original order)."""
+    keys = {str(c).strip().upper() for c in wanted}
+    return [c for c in available if str(c).strip().upper() in keys]
+
+def _write_table(folder: str, table_name: str, df: pd.DataFrame):
+    """Writes one table in columnar format (Parquet), falling back to pickle for mixed-type columns."""
+    stem = os.path.join(folder, _table_stem(table_name))
+    tmp = os.path.join(folder, f".tmp-{uuid.uuid4().hex}")
+    try:
+        if HAS_PARQUET:
+            try:
+                df.to_parquet(tmp, index=False)
+                os.replace(tmp, f"{stem}.parquet")
+                return
+            except Exception:
+                # SQLite is dynamically typed: a column can mix str/int/float, which Arrow refuses.
+                pass
+        df.to_pickle(tmp)
+        os.replace(tmp, f"{stem}.pkl")
+    finally:
+        if os.path.exists(tmp): os.remove(tmp)
+
+def _read_table(folder: str, table_name: str, columns=None) -> pd.DataFrame:
+    stem = os.path.join(folder, _table_stem(table_name))
+    if os.path.exists(f"{stem}.parquet"):
+        if columns is None: return pd.read_parquet(f"{stem}.parquet")
+        # [+] [INFO] Column projection is done by the Parquet reader: unused columns are never decoded.
+        names = pyarrow.parquet.ParquetFile(f"{stem}.parquet").schema_arrow.names
+        return pd.read_parquet(f"{stem}.parquet", columns=match_columns(names, columns))
+    if os.path.exists(f"{stem}.pkl"):
+        df = pd.read_pickle(f"{stem}.pkl")
+        return df if columns is None else df[match_columns(df.columns, columns)]
+    return None
+
+def load_table_names(digest: str):
+    """Table list of a cached file, or None if this content was never opened."""
+    if not is_enabled(): return None
+    index_path = os.path.join(_entry_dir(digest), TABLES_INDEX)
+    try:
+        with open(index_path, "r", encoding="utf-8") as f: names = json.load(f)
+        # [decision:logic] LRU bookkeeping: the index mtime is the last access time.
+        os.utime(index_path, None)
+        return names
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[ParseCache] Corrupted entry {digest[:12]}: {e}")
+        shutil.rmtree(_entry_dir(digest), ignore_errors=True)
+        return None
+
+def store_table_names(digest: str, names: list):
+    if not is_enabled(): return
+    folder = _entry_dir(digest)
+    tmp = os.path.join(folder, f".tmp-{uuid.uuid4().hex}")
+    try:
+        os.makedirs(folder, exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f: json.dump(list(names), f)
+        os.replace(tmp, os.path.join(folder, TABLES_INDEX))
+    except Exception as e:
+        print(f"[ParseCache] Store failed for {digest[:12]}: {e}")
+        if os.path.exists(tmp): os.remove(tmp)
+
+def load_table(digest: str, table_name: str, columns=None):
+    """
+    Returns one cached table (optionally projected on `columns`), or None on a miss.
+    Each call returns a fresh DataFrame, so callers are free to mutate it.
+    """
+    if not is_enabled(): return None
+    try:
+        return _read_table(_entry_dir(digest), table_name, columns)
+    except Exception as e:
+        print(f"[ParseCache] Unreadable table {table_name} in {digest[:12]}: {e}")
+        return None
+
+def store_table(digest: str, table_name: str, df: pd.DataFrame):
+    """Persists one full table atomically (temp file + rename)."""
+    if not is_enabled(): return
+    folder = _entry_dir(digest)
+    try:
+        os.makedirs(folder, exist_ok=True)
+        _write_table(folder, table_name, df)
+    except Exception as e:
+        print(f"[ParseCache] Store failed for {table_name} in {digest[:12]}: {e}")
+
+# --- DERIVED RESULTS ---
+# [+] [INFO] Small JSON results computed from one file (e.g. loadflow per-file rows) live in the same
+# entry as its tables: same key, same LRU clock, evicted together.
+
+def _result_path(digest: str, name: str) -> str:
+    return os.path.join(_entry_dir(digest), "results", f"{_table_stem(name)}.json")
+
+def load_result(digest: str, name: str):
+    """Cached JSON result `name` of this content, or None."""
+    if not is_enabled(): return None
+    try:
+        with open(_result_path(digest, name), "r", encoding="utf-8") as f: payload = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[ParseCache] Unreadable result {name} in {digest[:12]}: {e}")
+        return None
+    # LRU clock of the entry: its table index, or the entry folder itself for result-only entries
+    # (e.g. the transformer map keyed by a workspace fingerprint), see _last_access
+    try: os.utime(os.path.join(_entry_dir(digest), TABLES_INDEX), None)
+    except OSError:
+        try: os.utime(_entry_dir(digest), None)
+        except OSError: pass
+    return payload
+
+def store_result(digest: str, name: str, payload):
+    if not is_enabled(): return
+    path = _result_path(digest, name)
+    tmp = f"{path}.tmp-{uuid.uuid4().hex}"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f: json.dump(payload, f, default=str)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"[ParseCache] Store failed for result {name} in {digest[:12]}: {e}")
+        if os.path.exists(tmp): os.remove(tmp)
+
+# --- EVICTION ---
+
+def _dir_size(path: str) -> int:
+    total = 0
+    try:
+        for entry in os.scandir(path):
+            if entry.is_file(): total += entry.stat().st_size
+            elif entry.is_dir(): total += _dir_size(entry.path)
+    except Exception:
+        pass
+    return total
+
+def _last_access(path: str) -> float:
+    try: return os.path.getmtime(os.path.join(path, TABLES_INDEX))
+    except OSError: return os.path.getmtime(path)
+
+def enforce_budget(root: str = CACHE_DIR, max_mb: float = CACHE_MAX_MB):
+    """Evicts the least recently used entries of `root` until it fits in `max_mb`."""
+    if not os.path.isdir(root): return
+    entries = []
+    now = time.time()
+    for entry in os.scandir(root):
+        if not entry.is_dir(): continue
+        if entry.name.startswith(".tmp-"):
+            # Leftover of a crashed writer (older than one hour).
+            try:
+                if now - entry.stat().st_mtime > 3600: shutil.rmtree(entry.path, ignore_errors=True)
+            except OSError: pass
+            continue
+        entries.append((_last_access(entry.path), _dir_size(entry.path), entry.path))
+
+    budget = max_mb * 1024 * 1024
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= budget: break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
@@ -1,11 +1,28 @@
 
+import os
+import json
 import networkx as nx
-from collections import defaultdict
+from typing import Optional
+from app.calculations import topology_layout, topology_setup, parse_cache
 
-def build_diagram(analysis_result: dict) -> dict:
+ANALYSIS_TYPES = ['incomer', 'bus', 'transformer', 'cable', 'coupling', 'incomer_breaker']
+
+def equipment_details(analysis_result: dict) -> dict:
+    """{equipment id: analysis row + 'component_label'} (the diagram 'details' map, last type wins)."""
+    all_equipment = {}
+    for component_type in ANALYSIS_TYPES:
+        for item in analysis_result.get(f'{component_type}_analysis', []):
+            item_id = item.get('IDBus') or item.get('ID')
+            if item_id:
+                item['component_label'] = component_type.replace('_', ' ').title()
+                all_equipment[item_id] = item
+    return all_equipment
+
+def build_diagram(analysis_result: dict, seed: Optional[dict] = None) -> dict:
     """
     Builds a React Flow diagram using a "Vertical Center & Shift" layout algorithm 
     with fixed node sizes for a clean, uniform top-to-bottom appearance.
+    `seed` (a previously saved diagram of the same network) keeps the unchanged nodes in place.
     """
     nodes_for_flow = []
     edges_for_flow = []
@@ -13,15 +30,8 @@ def build_diagram(analysis_result: dict) -> dict:
     G = nx.DiGraph()
 
     # 1. Build Graph from analysis results
-    all_equipment = {}
-    analysis_types = ['incomer', 'bus', 'transformer', 'cable', 'coupling', 'incomer_breaker']
-    for component_type in analysis_types:
-        for item in analysis_result.get(f'{component_type}_analysis', []):
-            item_id = item.get('IDBus') or item.get('ID')
-            if item_id:
-                item['component_label'] = component_type.replace('_', ' ').title()
-                all_equipment[item_id] = item
-                G.add_node(item_id)
+    all_equipment = equipment_details(analysis_result)
+    G.add_nodes_from(all_equipment)
 
     for incomer in analysis_result.get('incomer_analysis', []):
         if incomer.get('ID') and incomer.get('ConnectedBus'):
@@ -33,68 +43,16 @@ def build_diagram(analysis_result: dict) -> dict:
             G.add_edge(from_node, conn_id)
             G.add_edge(conn_id, to_node)
 
-    # --- LAYOUT ALGORITHM: "Vertical Center & Shift" ---
-    positions = {}
-    OPTIMAL_WIDTH = 400
-    OPTIMAL_HEIGHT = 300
+    # --- LAYOUT ALGORITHM: "Vertical Center & Shift" (layered, see topology_layout) ---
+    OPTIMAL_WIDTH = topology_layout.NODE_WIDTH
+    OPTIMAL_HEIGHT = topology_layout.NODE_HEIGHT
 
-    try:
-        if not nx.is_directed_acyclic_graph(G):
-            raise nx.NetworkXUnfeasible("Graph has cycles.")
-
-        # A. Assign levels (Y-coordinates) and pre-sort nodes to minimize crossings
-        nodes_by_level = defaultdict(list)
-        for i, generation in enumerate(nx.topological_generations(G)):
-            nodes_by_level[i] = sorted(list(generation))
-        max_level = len(nodes_by_level) - 1
-
-        node_order = {node: i for level in nodes_by_level.values() for i, node in enumerate(level)}
-        for _ in range(8):
-            for level in range(1, max_level + 1):
-                barycenters = {n: sum(node_order.get(p, 0) for p in G.predecessors(n)) / len(list(G.predecessors(n))) if list(G.predecessors(n)) else -1 for n in nodes_by_level[level]}
-                nodes_by_level[level].sort(key=lambda n: barycenters.get(n, -1))
-                for i, node in enumerate(nodes_by_level[level]): node_order[node] = i
-
-        # B. Pass 1: Idealistic Placement (Center under parents)
-        Y_SPACING = OPTIMAL_HEIGHT + 150 # Vertical spacing
-        for level in range(max_level + 1):
-            for node_id in nodes_by_level[level]:
-                width = OPTIMAL_WIDTH
-                ideal_x = 0
-                parents = list(G.predecessors(node_id))
-                if parents and all(p in positions for p in parents):
-                    parent_centers = [positions[p]['x'] + OPTIMAL_WIDTH / 2 for p in parents]
-                    ideal_x = sum(parent_centers) / len(parent_centers) - width / 2
-                positions[node_id] = {'x': ideal_x, 'y': level * Y_SPACING}
-        
-        # C. Pass 2: Resolve Overlaps by Shifting Subtrees to the Right
-        X_PADDING = 100
-        all_descendants = {n: nx.descendants(G, n) for n in G.nodes()}
-        for level in range(max_level + 1):
-            level_nodes = nodes_by_level[level]
-            level_nodes.sort(key=lambda n: positions[n]['x'])
-            
-            for i in range(1, len(level_nodes)):
-                left_node, right_node = level_nodes[i-1], level_nodes[i]
-                left_bound = positions[left_node]['x'] + OPTIMAL_WIDTH
-                right_bound = positions[right_node]['x']
-                
-                if right_bound < left_bound + X_PADDING:
-                    shift = (left_bound + X_PADDING) - right_bound
-                    nodes_to_shift = all_descendants[right_node].union({right_node})
-                    for node_to_shift in nodes_to_shift:
-                        if node_to_shift in positions:
-                            positions[node_to_shift]['x'] += shift
-
-        # D. Final Horizontal Centering
-        if positions:
-            min_x = min((p['x'] for p in positions.values()), default=0)
-            if min_x < 0:
-                for node_id in positions:
-                    positions[node_id]['x'] -= min_x
-
-    except (nx.NetworkXUnfeasible, nx.NetworkXError) as e:
-        print(f"Graph layout error: {e}.")
+    if seed:
+        positions = topology_layout.incremental_layout(list(G.nodes()), list(G.edges()), seed.get('nodes'), seed.get('edges'))
+    else:
+        positions = topology_layout.layered_layout(list(G.nodes()), list(G.edges()))
+    if positions is None:
+        print("Graph layout error: Graph has cycles..")
         positions = nx.spring_layout(G, iterations=50)
 
     # 4. Generate React Flow JSON with fixed sizes
@@ -112,3 +70,110 @@ def build_diagram(analysis_result: dict) -> dict:
         })
 
     return {"nodes": nodes_for_flow, "edges": edges_for_flow, "details": details_map}
+
+# --- COMPACT FORMAT ---
+# [structure:storage] Same diagram without the 'details' map (served by /topology/diagram/{file}/details/{node_id}):
+# nodes are stored column-wise and referenced by their position, edge styles are shared.
+COMPACT_FORMAT = "compact-v1"
+
+def _xy(position) -> tuple:
+    if isinstance(position, dict): return float(position.get('x', 0)), float(position.get('y', 0))
+    return float(position[0]), float(position[1]) # spring_layout fallback (array)
+
+def compact_diagram(diagram: dict) -> dict:
+    nodes = diagram.get("nodes", [])
+    index = {node["id"]: i for i, node in enumerate(nodes)}
+    types, type_index = [], {}
+    columns = {"label": [], "x": [], "y": [], "type": []}
+    for node in nodes:
+        ctype = node.get("data", {}).get("component_type")
+        if ctype not in type_index:
+            type_index[ctype] = len(types); types.append(ctype)
+        x, y = _xy(node.get("position", {}))
+        columns["label"].append(node["id"]); columns["x"].append(x); columns["y"].append(y)
+        columns["type"].append(type_index[ctype])
+
+    styles, style_index, edges = [], {}, []
+    for edge in diagram.get("edges", []):
+        # [decision:logic] Edges towards an equipment without a node (no ID column) are not drawable: dropped
+        if edge["source"] not in index or edge["target"] not in index: continue
+        style = {k: v for k, v in edge.items() if k not in ("id", "source", "target")}
+        key = json.dumps(style, sort_keys=True)
+        if key not in style_index:
+            style_index[key] = len(styles); styles.append(style)
+        edges.append([index[edge["source"]], index[edge["target"]], style_index[key]])
+
+    width = nodes[0].get("width", topology_layout.NODE_WIDTH) if nodes else topology_layout.NODE_WIDTH
+    height = nodes[0].get("height", topology_layout.NODE_HEIGHT) if nodes else topology_layout.NODE_HEIGHT
+    return {
+        "format": COMPACT_FORMAT,
+        "node_type": "custom", "node_size": {"width": width, "height": height},
+        "component_types": types, "nodes": columns,
+        "edge_styles": styles, "edges": edges,
+    }
+
+def expand_diagram(diagram: dict) -> dict:
+    """React Flow nodes/edges of a compact diagram (no details). Full diagrams are returned unchanged."""
+    if diagram.get("format") != COMPACT_FORMAT: return diagram
+    cols, size = diagram["nodes"], diagram.get("node_size", {})
+    labels = cols["label"]
+    nodes = [{
+        "id": label, "type": diagram.get("node_type", "custom"), "position": {'x': x, 'y': y},
+        "data": {'label': label, 'component_type': diagram["component_types"][t]},
+        "width": size.get("width"), "height": size.get("height"),
+    } for label, x, y, t in zip(labels, cols["x"], cols["y"], cols["type"])]
+    edges = [{"id": f"e-{labels[u]}-{labels[v]}", "source": labels[u], "target": labels[v], **diagram["edge_styles"][s]}
+             for u, v, s in diagram["edges"]]
+    return {"nodes": nodes, "edges": edges}
+
+# --- DETAILS (lazy fetch) ---
+# [+] [INFO] One JSON line per equipment + an index {id: [offset, length]} in the topology result cache:
+# a details request reads a single line instead of rebuilding (or shipping) the whole 'details' map.
+
+def _json_safe(value):
+    if isinstance(value, float) and value != value: return None # NaN is not valid JSON
+    if isinstance(value, dict): return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, list): return [_json_safe(v) for v in value]
+    return value
+
+def _build_details_index(details: dict):
+    lines, index, offset = [], {}, 0
+    for item_id, item in details.items():
+        line = (json.dumps(_json_safe(item), default=str) + "\n").encode("utf-8")
+        index[str(item_id)] = [offset, len(line)]
+        lines.append(line); offset += len(line)
+    return b"".join(lines), index
+
+def load_node_details(file_path: str, node_id: str):
+    """Details row of one diagram node (equipment id) of the study `file_path`, or None if it has no such node."""
+    filename = os.path.basename(file_path)
+    # [+] [INFO] Index found by the file's stat (path_digest): a click never re-reads the study when it is warm
+    digest = parse_cache.path_digest(file_path)
+    data_path = topology_setup.result_path(None, filename, "details.jsonl", digest=digest)
+    index_path = topology_setup.result_path(None, filename, "details.idx.json", digest=digest)
+    try:
+        with open(index_path, "r", encoding="utf-8") as f: index = json.load(f)
+        entry = index.get(str(node_id))
+        if entry is None: return None
+        with open(data_path, "rb") as f:
+            f.seek(entry[0])
+            return json.loads(f.read(entry[1]))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"[TopologyCache] Unreadable details index {index_path}: {e}")
+
+    with open(file_path, "rb") as f: file_content = f.read()
+    analysis = topology_setup.analyze_topology_cached(file_content, filename)
+    if analysis.get("status") != "success": return None
+    details = equipment_details(analysis)
+    if topology_setup.RESULT_CACHE_MAX_MB > 0:
+        data, index = _build_details_index(details)
+        # Keyed by the bytes actually analyzed (the file may have changed since the stat)
+        data_path = topology_setup.result_path(file_content, filename, "details.jsonl")
+        index_path = topology_setup.result_path(file_content, filename, "details.idx.json")
+        # Data first: an index never points into a missing file
+        topology_setup.write_cache_file(data_path, data.decode("utf-8"))
+        topology_setup.write_cache_file(index_path, json.dumps(index))
+    item = next((v for k, v in details.items() if str(k) == str(node_id)), None)
+    return _json_safe(item) if item is not None else None
@@ -0,0 +1,234 @@
+from typing import Dict, List, Optional
+
+# --- Layered (Sugiyama-style) layout for the topology diagrams ---
+# [?] [THOUGHT] Same drawing rules as the historical "Vertical Center & Shift" layout (levels from the
+# topological generations, barycenter ordering, children centered under their parents, overlaps pushed
+# to the right with their subtree) but every pass is linear in the graph size:
+#   - nodes are integers, predecessor lists are built once,
+#   - crossings are counted per pair of levels in O(E log V) and the best ordering is kept,
+#   - a pushed node records its offset, its children inherit it when their level is placed,
+#     instead of moving every descendant at push time.
+
+NODE_WIDTH = 400
+NODE_HEIGHT = 300
+X_PADDING = 100
+Y_SPACING = NODE_HEIGHT + 150
+SWEEPS = 8
+
+def _levels(n: int, preds: List[List[int]], succs: List[List[int]]) -> Optional[List[List[int]]]:
+    """Topological generations (Kahn). None if the graph has a cycle."""
+    indegree = [len(p) for p in preds]
+    current = [i for i in range(n) if indegree[i] == 0]
+    levels, seen = [], 0
+    while current:
+        levels.append(current)
+        seen += len(current)
+        nxt = []
+        for u in current:
+            for v in succs[u]:
+                indegree[v] -= 1
+                if indegree[v] == 0: nxt.append(v)
+        current = nxt
+    return levels if seen == n else None
+
+def _count_crossings(upper: List[int], lower: List[int], preds: List[List[int]], order: List[int], level_of: List[int]) -> int:
+    """Crossings between two adjacent levels (bilayer count with a Fenwick tree, O(E log V))."""
+    upper_level = level_of[upper[0]] if upper else -1
+    edges = sorted((order[p], order[v]) for v in lower for p in preds[v] if level_of[p] == upper_level)
+    size = len(lower)
+    tree = [0] * (size + 1)
+    crossings = 0
+    for count, (_, pos) in enumerate(edges):
+        # edges already inserted that end strictly right of `pos` cross this one
+        i, below = pos + 1, 0
+        while i > 0: below += tree[i]; i -= i & -i
+        crossings += count - below
+        i = pos + 1
+        while i <= size: tree[i] += 1; i += i & -i
+    return crossings
+
+def _order_levels(levels: List[List[int]], preds: List[List[int]], labels: List[str], sweeps: int) -> List[List[int]]:
+    level_of = [0] * len(labels)
+    for depth, level in enumerate(levels):
+        for i in level: level_of[i] = depth
+        level.sort(key=lambda i: labels[i])
+    order = [0] * len(labels)
+    for level in levels:
+        for pos, i in enumerate(level): order[i] = pos
+
+    def total_crossings():
+        return sum(_count_crossings(levels[d - 1], levels[d], preds, order, level_of) for d in range(1, len(levels)))
+
+    best, best_crossings = [list(level) for level in levels], total_crossings()
+    for _ in range(sweeps):
+        if best_crossings == 0: break
+        for level in levels[1:]:
+            barycenter = {i: (sum(order[p] for p in preds[i]) / len(preds[i]) if preds[i] else -1) for i in level}
+            level.sort(key=barycenter.__getitem__)
+            for pos, i in enumerate(level): order[i] = pos
+        crossings = total_crossings()
+        if crossings >= best_crossings: break
+        best, best_crossings = [list(level) for level in levels], crossings
+    return best
+
+def layered_layout(nodes: list, edges: list, sweeps: int = SWEEPS) -> Optional[Dict[object, dict]]:
+    """
+    Positions {node: {'x', 'y'}} (top-left corner of fixed size NODE_WIDTH x NODE_HEIGHT boxes).
+    Returns None if the graph has a cycle (the caller picks another layout).
+    """
+    index = {node: i for i, node in enumerate(nodes)}
+    n = len(nodes)
+    preds, succs = [[] for _ in range(n)], [[] for _ in range(n)]
+    for u, v in edges:
+        iu, iv = index[u], index[v]
+        preds[iv].append(iu); succs[iu].append(iv)
+
+    levels = _levels(n, preds, succs)
+    if levels is None: return None
+    levels = _order_levels(levels, preds, [str(node) for node in nodes], sweeps)
+
+    # A. Placement level by level: center under the parents, then push overlaps to the right.
+    # shift[i] = total offset applied to node i (inherited from its parents + its own push).
+    x, shift = [0.0] * n, [0.0] * n
+    for level in levels:
+        for i in level:
+            parents = preds[i]
+            if parents:
+                # Ideal x is computed on the parents before their push, their offset is inherited separately
+                inherited = max(shift[p] for p in parents)
+                x[i] = sum(x[p] - shift[p] for p in parents) / len(parents) + inherited
+                shift[i] = inherited
+        row = sorted(level, key=x.__getitem__)
+        for left, right in zip(row, row[1:]):
+            min_x = x[left] + NODE_WIDTH + X_PADDING
+            if x[right] < min_x:
+                shift[right] += min_x - x[right]
+                x[right] = min_x
+
+    # B. Final horizontal centering
+    min_x = min(x, default=0)
+    if min_x < 0: x = [v - min_x for v in x]
+
+    return {nodes[i]: {'x': x[i], 'y': depth * Y_SPACING} for depth, level in enumerate(levels) for i in level}
+
+# --- Incremental re-layout (seeded by a previous diagram) ---
+# [?] [THOUGHT] A revised study usually adds or removes a handful of buses/breakers. Nodes that kept
+# their level and their connections keep their saved position; only levels holding a new/changed node
+# are re-ordered (barycenter sweep, starting from the saved order), and only levels holding a moved
+# node (or a node pushed by an overlap above it) are re-placed.
+
+MIN_SEED_OVERLAP = 0.5 # Below this share of reusable nodes, a full layout looks better
+
+def _seed_positions(seed_nodes: list) -> dict:
+    positions = {}
+    for node in seed_nodes or []:
+        pos = node.get('position') if isinstance(node, dict) else None
+        if isinstance(pos, dict) and isinstance(pos.get('x'), (int, float)) and isinstance(pos.get('y'), (int, float)):
+            positions[node.get('id')] = pos
+    return positions
+
+def _reorder_levels(levels: List[List[int]], preds: List[List[int]], depths: List[int], sweeps: int):
+    """
+    Barycenter sweep of _order_levels restricted to the levels `depths` (re-ordered in place, current
+    order as the starting point; the other levels stay fixed). Only the crossings around those levels
+    are counted, the best ordering is kept.
+    """
+    n = sum(len(level) for level in levels)
+    level_of, order = [0] * n, [0] * n
+    for depth, level in enumerate(levels):
+        for pos, i in enumerate(level): level_of[i] = depth; order[i] = pos
+    pairs = sorted({d for depth in depths for d in (depth, depth + 1) if 1 <= d < len(levels)})
+
+    def crossings():
+        return sum(_count_crossings(levels[d - 1], levels[d], preds, order, level_of) for d in pairs)
+
+    best, best_crossings = {d: list(levels[d]) for d in depths}, crossings()
+    for _ in range(sweeps):
+        if best_crossings == 0: break
+        for d in depths:
+            level = levels[d]
+            # Nodes without parent (roots) keep their current slot
+            barycenter = {i: (sum(order[p] for p in preds[i]) / len(preds[i]) if preds[i] else order[i]) for i in level}
+            level.sort(key=barycenter.__getitem__)
+            for pos, i in enumerate(level): order[i] = pos
+        current = crossings()
+        if current >= best_crossings: break
+        best, best_crossings = {d: list(levels[d]) for d in depths}, current
+    for d in depths: levels[d][:] = best[d]
+
+def incremental_layout(nodes: list, edges: list, seed_nodes: list, seed_edges: list, sweeps: int = SWEEPS) -> Optional[Dict[object, dict]]:
+    """
+    Same contract as layered_layout, reusing the positions of a previous diagram
+    (`seed_nodes`: React Flow nodes with 'id'/'position', `seed_edges`: edges with 'source'/'target').
+    Falls back to a full layered_layout when the seed does not match the graph well enough.
+    """
+    index = {node: i for i, node in enumerate(nodes)}
+    n = len(nodes)
+    preds, succs = [[] for _ in range(n)], [[] for _ in range(n)]
+    for u, v in edges:
+        iu, iv = index[u], index[v]
+        preds[iv].append(iu); succs[iu].append(iv)
+
+    levels = _levels(n, preds, succs)
+    if levels is None: return None
+
+    # 1. Diff against the seed: a node is kept if it had a position on the same level and the same edges
+    seed = _seed_positions(seed_nodes)
+    old_edges = {(e.get('source'), e.get('target')) for e in seed_edges or [] if isinstance(e, dict)}
+    touched = set()
+    for u, v in old_edges.symmetric_difference(edges): touched.add(u); touched.add(v)
+    kept = [False] * n
+    for depth, level in enumerate(levels):
+        for i in level:
+            pos = seed.get(nodes[i])
+            kept[i] = pos is not None and pos['y'] == depth * Y_SPACING and nodes[i] not in touched
+    if sum(kept) < MIN_SEED_OVERLAP * n: return layered_layout(nodes, edges, sweeps)
+
+    # 2. Ordering: kept nodes in their saved left-to-right order, new nodes under the barycenter of their
+    # parents, new roots at the right end; then the crossing reduction runs on the affected levels.
+    estimate = [0.0] * n
+    for level in levels:
+        for i in level:
+            if kept[i]: estimate[i] = seed[nodes[i]]['x']
+            elif preds[i]: estimate[i] = sum(estimate[p] for p in preds[i]) / len(preds[i])
+        right = max((estimate[i] for i in level if kept[i] or preds[i]), default=-(NODE_WIDTH + X_PADDING))
+        for i in level:
+            if not kept[i] and not preds[i]:
+                right += NODE_WIDTH + X_PADDING
+                estimate[i] = right
+        level.sort(key=lambda i: (estimate[i], not kept[i]))
+    affected = [depth for depth, level in enumerate(levels) if not all(kept[i] for i in level)]
+    if affected: _reorder_levels(levels, preds, affected, sweeps)
+
+    # 3. Placement: untouched levels are copied, the others are placed in their order and de-overlapped.
+    # shift[i] = push applied to node i (inherited from its parents + its own), as in layered_layout.
+    x, shift = [0.0] * n, [0.0] * n
+    for depth, level in enumerate(levels):
+        for i in level:
+            shift[i] = max((shift[p] for p in preds[i]), default=0.0)
+        if all(kept[i] and not shift[i] for i in level):
+            for i in level: x[i] = seed[nodes[i]]['x']
+            continue
+
+        placed = []
+        for i in level:
+            if kept[i]: x[i] = seed[nodes[i]]['x'] + shift[i]; placed.append(i)
+            elif preds[i]:
+                # Barycenter of the (final) parent positions: the new node is centered under them
+                x[i] = sum(x[p] for p in preds[i]) / len(preds[i]); placed.append(i)
+
+        # In level order: a new root takes the next free slot, any other node is pushed right on overlap
+        left = None
+        for i in level:
+            if not kept[i] and not preds[i]:
+                x[i] = x[left] + NODE_WIDTH + X_PADDING if left is not None else min((x[j] for j in placed), default=NODE_WIDTH + X_PADDING) - (NODE_WIDTH + X_PADDING)
+            elif left is not None and x[i] < x[left] + NODE_WIDTH + X_PADDING:
+                min_x = x[left] + NODE_WIDTH + X_PADDING
+                shift[i] += min_x - x[i]
+                x[i] = min_x
+            left = i
+
+    min_x = min(x, default=0)
+    if min_x < 0: x = [v - min_x for v in x]
+
+    return {nodes[i]: {'x': x[i], 'y': depth * Y_SPACING} for depth, level in enumerate(levels) for i in level}
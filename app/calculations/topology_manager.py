@@ -2,6 +2,9 @@
 import pandas as pd
 import numpy as np
 
+# [+] [INFO] Tables read by resolve_all (whitelist for db_converter)
+REQUIRED_TABLES = ['PD_XFMR2', 'XFMR2', 'IXFMR2', 'TRANSFORMERS', 'ICONNECT', 'CONNECT', 'PD_LINK', 'LN_LINK']
+
 # --- UTILITAIRES ---
 def get_col_value(row, candidates):
     """Cherche la valeur dans la première colonne trouvée parmi les candidats"""
@@ -10,30 +13,101 @@ def get_col_value(row, candidates):
             return str(row[col]).strip()
     return None
 
+# --- INDEX DES ÉQUIPEMENTS ---
+XFMR_ID_COLS = ['ID', 'NAME', 'XFMR ID']
+XFMR_FROM_COLS, XFMR_TO_COLS = ['FromBus', 'From', 'PrimBus'], ['ToBus', 'To', 'SecBus']
+ICONNECT_ID_COLS = ['ID', 'NAME', 'DEVICE ID']
+# On cherche exactement les colonnes demandées en priorité :
+# 'From' pour le bus amont, 'ToSec' pour le bus aval (spécifique IConnect)
+ICONNECT_FROM_COLS, ICONNECT_TO_COLS = ['From', 'FromBus', 'From Bus'], ['ToSec', 'To Sec', 'ToBus', 'To']
+
+class DeviceIndex:
+    """
+    Index ID normalisé -> ligne d'une table d'équipements (IXFMR2, IConnect...), construit une fois par fichier.
+    Même règle que l'ancien filtre `df[col_id].astype(str).str.strip() == str(id).strip()` : première ligne gagnante.
+    """
+    def __init__(self, df, id_cols, from_cols, to_cols):
+        self.df = df
+        self.present = df is not None and not df.empty
+        self.col_id = next((c for c in df.columns if c.upper() in id_cols), None) if self.present else None
+        self.from_cols, self.to_cols = from_cols, to_cols
+        self._positions = {}
+        self._buses = {}
+        if self.col_id:
+            for pos, key in enumerate(df[self.col_id].astype(str).str.strip().tolist()):
+                self._positions.setdefault(key, pos)
+
+    def buses(self, device_id):
+        """(bus amont, bus aval) de l'équipement, ou None s'il n'est pas dans la table."""
+        key = str(device_id).strip()
+        if key not in self._buses:
+            pos = self._positions.get(key)
+            if pos is None: self._buses[key] = None
+            else:
+                row = self.df.iloc[pos]
+                self._buses[key] = (get_col_value(row, self.from_cols), get_col_value(row, self.to_cols))
+        return self._buses[key]
+
+def _as_index(table, id_cols, from_cols, to_cols):
+    return table if isinstance(table, DeviceIndex) else DeviceIndex(table, id_cols, from_cols, to_cols)
+
+def _find_tables(dfs_dict):
+    # 1. Table Transfos (IXFMR2)
+    df_xfmr = None
+    for key in dfs_dict.keys():
+        if key.upper() in ['PD_XFMR2', 'XFMR2', 'IXFMR2', 'TRANSFORMERS']:
+            df_xfmr = dfs_dict[key]; break
+            
+    # 2. Table IConnect (Priorité absolue sur le nom 'ICONNECT')
+    df_iconnect = None
+    
+    # Recherche prioritaire de "ICONNECT" exact
+    for key in dfs_dict.keys():
+        if key.upper() == 'ICONNECT':
+            df_iconnect = dfs_dict[key]
+            break
+            
+    # Si pas trouvé "ICONNECT", on cherche les synonymes (CONNECT, PD_LINK)
+    if df_iconnect is None:
+        for key in dfs_dict.keys():
+            if key.upper() in ['CONNECT', 'PD_LINK', 'LN_LINK']:
+                df_iconnect = dfs_dict[key]
+                break
+    return df_xfmr, df_iconnect
+
+def _build_device_indexes(dfs_dict):
+    df_xfmr, df_iconnect = _find_tables(dfs_dict)
+    return (DeviceIndex(df_xfmr, XFMR_ID_COLS, XFMR_FROM_COLS, XFMR_TO_COLS),
+            DeviceIndex(df_iconnect, ICONNECT_ID_COLS, ICONNECT_FROM_COLS, ICONNECT_TO_COLS))
+
+def get_device_indexes(dfs_dict):
+    """(index transfos, index IConnect) du fichier, partagés par les runs d'une même requête (memo LazyTables/TableDict)."""
+    memo = getattr(dfs_dict, "memo", None)
+    if memo is not None: return memo("device_indexes", lambda: _build_device_indexes(dfs_dict))
+    return _build_device_indexes(dfs_dict)
+
 # --- LOGIQUE TRANSFO (Inchangée) ---
-def resoudre_topologie_transformer(plan, df_xfmr_global):
+def resoudre_topologie_transformer(plan, xfmr_index):
+    """`xfmr_index` : DeviceIndex de la table transfos (un DataFrame est aussi accepté)."""
     if plan.type != 'TRANSFORMER': return plan
     
     user_from, user_to = plan.bus_from, plan.bus_to
     tx_id = plan.related_source
+    idx = _as_index(xfmr_index, XFMR_ID_COLS, XFMR_FROM_COLS, XFMR_TO_COLS)
     
-    if not tx_id or df_xfmr_global is None or df_xfmr_global.empty: 
+    if not tx_id or not idx.present: 
         plan.topology_origin = "config_user"
         return plan
 
-    df_x = df_xfmr_global.copy()
-    col_id = next((c for c in df_x.columns if c.upper() in ['ID', 'NAME', 'XFMR ID']), None)
-    
-    if not col_id:
+    if not idx.col_id:
         plan.topology_origin = "config_user"
         return plan
         
-    row_tx = df_x[df_x[col_id].astype(str).str.strip() == str(tx_id).strip()]
+    found = idx.buses(tx_id)
     
-    if not row_tx.empty:
+    if found is not None:
         # Priorité Script
-        bus_prim = get_col_value(row_tx.iloc[0], ['FromBus', 'From', 'PrimBus'])
-        bus_sec = get_col_value(row_tx.iloc[0], ['ToBus', 'To', 'SecBus'])
+        bus_prim, bus_sec = found
         
         if bus_prim: plan.bus_from = bus_prim
         if bus_sec: plan.bus_to = bus_sec
@@ -47,41 +121,33 @@ def resoudre_topologie_transformer(plan, df_xfmr_global):
     return plan
 
 # --- LOGIQUE COUPLING & INCOMER (Mise à jour IConnect) ---
-def resoudre_topologie_iconnect(plan, df_iconnect):
+def resoudre_topologie_iconnect(plan, iconnect_index):
     """
-    Cherche spécifiquement dans la table IConnect.
+    Cherche spécifiquement dans la table IConnect (DeviceIndex, ou DataFrame).
     Cibles : From -> bus_from, ToSec -> bus_to.
     """
     if plan.type not in ['COUPLING', 'INCOMER']: return plan
     
     device_id = plan.id
     user_from, user_to = plan.bus_from, plan.bus_to
+    idx = _as_index(iconnect_index, ICONNECT_ID_COLS, ICONNECT_FROM_COLS, ICONNECT_TO_COLS)
     
     # 1. Si pas de table IConnect trouvée
-    if df_iconnect is None or df_iconnect.empty:
+    if not idx.present:
         plan.topology_origin = "config_user"
         plan.debug_info = "Table IConnect absente du SI2S."
         return plan
         
-    # 2. Recherche de l'ID
-    df_c = df_iconnect.copy()
-    # On cherche la colonne ID (souvent 'ID' tout court)
-    col_id = next((c for c in df_c.columns if c.upper() in ['ID', 'NAME', 'DEVICE ID']), None)
-    
-    if not col_id:
+    # 2. Recherche de l'ID (colonne 'ID' tout court le plus souvent)
+    if not idx.col_id:
         plan.topology_origin = "config_user"
         return plan
         
-    row = df_c[df_c[col_id].astype(str).str.strip() == str(device_id).strip()]
+    found = idx.buses(device_id)
     
     # 3. SI TROUVÉ -> EXTRACTION & OVERWRITE
-    if not row.empty:
-        # On cherche exactement les colonnes que tu as demandées en priorité
-        # 'From' pour le bus amont
-        # 'ToSec' pour le bus aval (spécifique IConnect)
-        
-        bus_from = get_col_value(row.iloc[0], ['From', 'FromBus', 'From Bus'])
-        bus_to = get_col_value(row.iloc[0], ['ToSec', 'To Sec', 'ToBus', 'To'])
+    if found is not None:
+        bus_from, bus_to = found
         
         if bus_from: plan.bus_from = bus_from
         if bus_to: plan.bus_to = bus_to
@@ -97,38 +163,51 @@ def resoudre_topologie_iconnect(plan, df_iconnect):
         
     return plan
 
+# --- VUE PAR FICHIER (copy-on-write) ---
+class ResolvedPlan:
+    """
+    Vue d'un ProtectionPlan pour un fichier : les champs résolus (bus_from, bus_to, topology_origin,
+    debug_info, meta_data) sont écrits dans la vue, tout le reste est lu sur le plan partagé.
+    Remplace le deepcopy de la config par fichier : le ProjectConfig n'est jamais modifié.
+    """
+    __slots__ = ("_plan", "_overrides")
+
+    def __init__(self, plan):
+        object.__setattr__(self, "_plan", plan)
+        object.__setattr__(self, "_overrides", {})
+
+    def __getattr__(self, name):
+        overrides = object.__getattribute__(self, "_overrides")
+        if name in overrides: return overrides[name]
+        return getattr(object.__getattribute__(self, "_plan"), name)
+
+    def __setattr__(self, name, value):
+        self._overrides[name] = value
+
+    def __repr__(self):
+        return f"ResolvedPlan({self._plan.id!r}, {self._overrides!r})"
+
+def overlay_plans(config):
+    """Une vue ResolvedPlan par plan de la config (à résoudre avec resolve_plans)."""
+    return [ResolvedPlan(plan) for plan in config.plans]
+
 # --- ORCHESTRATEUR ---
 def resolve_all(config, dfs_dict):
-    
-    # 1. Table Transfos (IXFMR2)
-    df_xfmr = None
-    for key in dfs_dict.keys():
-        if key.upper() in ['PD_XFMR2', 'XFMR2', 'IXFMR2', 'TRANSFORMERS']:
-            df_xfmr = dfs_dict[key]; break
-            
-    # 2. Table IConnect (Priorité absolue sur le nom 'ICONNECT')
-    df_iconnect = None
-    
-    # Recherche prioritaire de "ICONNECT" exact
-    for key in dfs_dict.keys():
-        if key.upper() == 'ICONNECT':
-            df_iconnect = dfs_dict[key]
-            break
-            
-    # Si pas trouvé "ICONNECT", on cherche les synonymes (CONNECT, PD_LINK)
-    if df_iconnect is None:
-        for key in dfs_dict.keys():
-            if key.upper() in ['CONNECT', 'PD_LINK', 'LN_LINK']:
-                df_iconnect = dfs_dict[key]
-                break
+    """Résout la topologie directement sur les plans de `config` (modifiée en place)."""
+    resolve_plans(config.plans, dfs_dict)
+    return config
 
-    # 3. Exécution
-    for plan in config.plans:
+def resolve_plans(plans, dfs_dict):
+    """Résout la topologie de `plans` (ProtectionPlan ou ResolvedPlan) à partir des tables du fichier."""
+    # [+] [INFO] Un index ID -> ligne par table et par fichier : plus de copie ni de filtre par plan
+    xfmr_index, iconnect_index = get_device_indexes(dfs_dict)
+
+    for plan in plans:
         if plan.type == 'TRANSFORMER':
-            resoudre_topologie_transformer(plan, df_xfmr)
+            resoudre_topologie_transformer(plan, xfmr_index)
             
         elif plan.type in ['COUPLING', 'INCOMER']:
             # On utilise la nouvelle logique IConnect
-            resoudre_topologie_iconnect(plan, df_iconnect)
+            resoudre_topologie_iconnect(plan, iconnect_index)
             
-    return config
+    return plans
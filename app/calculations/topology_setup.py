@@ -1,6 +1,26 @@
 
+import os
+import json
+import uuid
+import numpy as np
 import pandas as pd
-from app.calculations import db_converter
+from pandas.api.types import is_object_dtype, is_string_dtype
+from app.calculations import db_converter, parse_cache
+
+# [+] [INFO] Tables read by analyze_topology (whitelist for db_converter)
+REQUIRED_TABLES = ['ICONNECT', 'CONNECT', 'PD_LINK', 'LN_LINK', 'IUTILITY', 'LFSOURCELOAD',
+                   'IXFMR2', 'XFMR2', 'ICABLE', 'CABLE', 'IBUS', 'BUS']
+
+# --- RESULT CACHE ---
+# [structure:storage] Full analyze_topology results, keyed by file content (SHA-256) and extension
+# (the incomer rule depends on it). A changed file has a new digest, so stale entries are never read.
+# Own folder and disk budget, evicted LRU like the parse cache. Outside STORAGE_ROOT for the same reason
+# (storage_admin treats any unknown folder there as an orphan).
+RESULT_CACHE_DIR = os.getenv("TOPOLOGY_CACHE_DIR", "/app/cache/topology")
+# Disk budget in MB. 0 disables the cache entirely.
+RESULT_CACHE_MAX_MB = float(os.getenv("TOPOLOGY_CACHE_MAX_MB", "512"))
+RESULT_VERSION = 1 # Bump when the classification rules change
+
 
 def get_col_name(df, candidates):
     """Finds the first matching column name from a list of candidates."""
@@ -12,12 +32,32 @@ def get_col_name(df, candidates):
                 return df_col
     return None
 
+def _node_values(df, cols):
+    """Distinct values of `cols` (the node set of the iConnect graph, empty cells included)."""
+    values = np.concatenate([df[c].to_numpy(dtype=object) for c in cols])
+    return pd.unique(values) if len(values) else values
+
+def _connected(df, cols, nodes):
+    """Row mask: at least one of `cols` is in `nodes`."""
+    nodes = list(nodes) if isinstance(nodes, set) else nodes
+    mask = np.zeros(len(df), dtype=bool)
+    if len(nodes) == 0: return mask
+    for c in cols: mask |= df[c].isin(nodes).to_numpy(dtype=bool)
+    return mask
+
+def _records(df, label) -> list:
+    """Rows of `df` as dicts tagged with 'topology_calculated' (`label`: one value, or one per row)."""
+    records = df.to_dict(orient='records')
+    labels = [label] * len(records) if isinstance(label, str) else label
+    for entry, value in zip(records, labels): entry['topology_calculated'] = value
+    return records
+
 def analyze_topology(file_content: bytes, filename: str) -> dict:
     """
     Analyzes file content to extract topology and identify key components like
     incomers, transformers, cables, buses, and couplings.
     """
-    dataframes = db_converter.extract_data_from_db(file_content)
+    dataframes = db_converter.extract_data_from_db(file_content, tables=REQUIRED_TABLES)
     if not dataframes:
         return {"status": "error", "message": "Could not extract dataframes from file."}
 
@@ -36,7 +76,9 @@ def analyze_topology(file_content: bytes, filename: str) -> dict:
     if not all([id_col, from_col, tosec_col]):
         return {"status": "error", "message": "Essential columns missing from iConnect."}
 
-    iconnect_nodes = set(df_iconnect[id_col].unique()) | set(df_iconnect[from_col].unique()) | set(df_iconnect[tosec_col].unique())
+    # [+] [INFO] Classification is done with column masks (isin) over whole tables; rows are
+    # turned into dicts only once, for the entries that end up in the result.
+    iconnect_nodes = _node_values(df_iconnect, [id_col, from_col, tosec_col])
 
     # --- Dataframes for other components ---
     df_iutility = next((df for name, df in dataframes.items() if name.upper() == 'IUTILITY'), None)
@@ -53,32 +95,25 @@ def analyze_topology(file_content: bytes, filename: str) -> dict:
     if file_ext == 'si2s' and df_iutility is not None:
         bus_col_util = get_col_name(df_iutility, ['CONNECTEDBUS'])
         if bus_col_util:
-            for _, row in df_iutility.iterrows():
-                bus_name = row[bus_col_util]
-                if bus_name in iconnect_nodes:
-                    entry = row.to_dict()
-                    entry['topology_calculated'] = 'INCOMER'
-                    incomer_info.append(entry)
-                    incomer_buses.add(bus_name)
+            matched = df_iutility[_connected(df_iutility, [bus_col_util], iconnect_nodes)]
+            incomer_info = _records(matched, 'INCOMER')
+            incomer_buses = set(matched[bus_col_util])
 
     elif file_ext == 'lf1s' and df_lfsource is not None:
         id_term_bus_col = get_col_name(df_lfsource, ['IDTERMBUS'])
         kv_col = get_col_name(df_lfsource, ['RATEDKV', 'BUSNOMINALKV'])
         if id_term_bus_col and kv_col:
-            matched_sources = df_lfsource[df_lfsource[id_term_bus_col].isin(iconnect_nodes)].copy()
+            matched_sources = df_lfsource[_connected(df_lfsource, [id_term_bus_col], iconnect_nodes)].copy()
             if not matched_sources.empty:
                 matched_sources['voltage_level'] = pd.to_numeric(matched_sources[kv_col], errors='coerce').fillna(0)
                 sorted_sources = matched_sources.sort_values(by='voltage_level', ascending=False)
                 voltage_ranks = {kv: rank for rank, kv in enumerate(sorted(sorted_sources['voltage_level'].unique(), reverse=True), 1)}
                 sorted_sources['voltage_rank'] = sorted_sources['voltage_level'].map(voltage_ranks)
-                for _, row in sorted_sources.iterrows():
-                    entry = row.to_dict()
-                    if row['voltage_rank'] == 1:
-                        entry['topology_calculated'] = 'INCOMER'
-                        incomer_buses.add(row[id_term_bus_col])
-                    else:
-                        entry['topology_calculated'] = f'LEVEL_{row["voltage_rank"]}'
-                    incomer_info.append(entry)
+                ranks = sorted_sources['voltage_rank'].tolist()
+                incomer_info = _records(sorted_sources, [
+                    'INCOMER' if rank == 1 else f'LEVEL_{rank}' for rank in ranks
+                ])
+                incomer_buses = set(sorted_sources.loc[(sorted_sources['voltage_rank'] == 1).to_numpy(), id_term_bus_col])
     
     # --- 3. Identify Buses ---
     bus_info = []
@@ -87,11 +122,7 @@ def analyze_topology(file_content: bytes, filename: str) -> dict:
         bus_id_col = get_col_name(df_ibus, ['IDBUS', 'ID'])
         bus_kv_col = get_col_name(df_ibus, ['BASEKV', 'NOMLKV'])
         if bus_id_col:
-            for _, row in df_ibus.iterrows():
-                if row[bus_id_col] in iconnect_nodes:
-                    entry = row.to_dict()
-                    entry['topology_calculated'] = 'BUS'
-                    bus_info.append(entry)
+            bus_info = _records(df_ibus[_connected(df_ibus, [bus_id_col], iconnect_nodes)], 'BUS')
             if bus_kv_col:
                 temp_map = df_ibus.set_index(bus_id_col)[bus_kv_col].to_dict()
                 bus_voltage_map = {str(k): v for k, v in temp_map.items()}
@@ -106,13 +137,11 @@ def analyze_topology(file_content: bytes, filename: str) -> dict:
         prim_kv_col = get_col_name(df_ixfmr2, ['PRIMKV'])
         sec_kv_col = get_col_name(df_ixfmr2, ['SECKV'])
         if all([xfmr_id_col, xfmr_from_col, xfmr_to_col]):
-            for _, row in df_ixfmr2.iterrows():
-                if (row[xfmr_id_col] in iconnect_nodes or row[xfmr_from_col] in iconnect_nodes or row[xfmr_to_col] in iconnect_nodes):
-                    entry = row.to_dict()
-                    entry['topology_calculated'] = 'TRANSFORMER'
-                    if prim_kv_col and pd.notna(row[prim_kv_col]): entry['primary_voltage_kV'] = row[prim_kv_col]
-                    if sec_kv_col and pd.notna(row[sec_kv_col]): entry['secondary_voltage_kV'] = row[sec_kv_col]
-                    transformer_info.append(entry)
+            matched = df_ixfmr2[_connected(df_ixfmr2, [xfmr_id_col, xfmr_from_col, xfmr_to_col], iconnect_nodes)]
+            transformer_info = _records(matched, 'TRANSFORMER')
+            for entry in transformer_info:
+                if prim_kv_col and pd.notna(entry[prim_kv_col]): entry['primary_voltage_kV'] = entry[prim_kv_col]
+                if sec_kv_col and pd.notna(entry[sec_kv_col]): entry['secondary_voltage_kV'] = entry[sec_kv_col]
 
     # --- 5. Identify Cables ---
     cable_info = []
@@ -121,37 +150,31 @@ def analyze_topology(file_content: bytes, filename: str) -> dict:
         cable_from_col = get_col_name(df_icable, ['FROMBUS', 'FROM'])
         cable_to_col = get_col_name(df_icable, ['TOBUS', 'TO'])
         if all([cable_id_col, cable_from_col, cable_to_col]):
-            for _, row in df_icable.iterrows():
-                if (row[cable_id_col] in iconnect_nodes or row[cable_from_col] in iconnect_nodes or row[cable_to_col] in iconnect_nodes):
-                    entry = row.to_dict()
-                    entry['topology_calculated'] = 'CABLE'
-                    cable_info.append(entry)
+            cable_info = _records(df_icable[_connected(df_icable, [cable_id_col, cable_from_col, cable_to_col], iconnect_nodes)], 'CABLE')
 
     # --- 6. Identify Couplings and Incomer Breakers ---
     coupling_info = []
     incomer_breaker_info = []
     if type_col and bus_voltage_map:
-        for _, row in df_iconnect.iterrows():
-            is_breaker = False
-            if pd.notna(row[type_col]) and ('CB' in row[type_col].upper() or 'TIE' in row[type_col].upper()):
-                is_breaker = True
-            
-            if is_breaker:
-                from_bus = row[from_col]
-                to_bus = row[tosec_col]
-                
-                from_voltage = bus_voltage_map.get(from_bus)
-                to_voltage = bus_voltage_map.get(to_bus)
-
-                if from_voltage is not None and from_voltage == to_voltage:
-                    entry = row.to_dict()
-                    if from_bus in incomer_buses or to_bus in incomer_buses:
-                        entry['topology_calculated'] = 'INCOMER_BREAKER'
-                        incomer_breaker_info.append(entry)
-                    else:
-                        entry['topology_calculated'] = 'COUPLING'
-                        entry['coupling_voltage_kV'] = from_voltage
-                        coupling_info.append(entry)
+        types = df_iconnect[type_col]
+        is_breaker = np.zeros(len(df_iconnect), dtype=bool)
+        if is_object_dtype(types) or is_string_dtype(types):
+            upper = types.str.upper()
+            is_breaker = (upper.str.contains('CB', regex=False, na=False) | upper.str.contains('TIE', regex=False, na=False)).to_numpy(dtype=bool)
+
+        # Same bus voltage on both sides (a missing voltage never matches)
+        # [!] Plain dict lookups, not Series.map: the raw kV values (int stays int) end up in the result
+        from_voltage = [bus_voltage_map.get(bus) for bus in df_iconnect[from_col]]
+        to_voltage = [bus_voltage_map.get(bus) for bus in df_iconnect[tosec_col]]
+        same_voltage = np.fromiter((f is not None and f == t for f, t in zip(from_voltage, to_voltage)), dtype=bool, count=len(df_iconnect))
+
+        selected = np.flatnonzero(is_breaker & same_voltage)
+        breakers = df_iconnect.iloc[selected]
+        on_incomer = _connected(breakers, [from_col, tosec_col], incomer_buses)
+        incomer_breaker_info = _records(breakers[on_incomer], 'INCOMER_BREAKER')
+        coupling_info = _records(breakers[~on_incomer], 'COUPLING')
+        for entry, pos in zip(coupling_info, selected[~on_incomer]):
+            entry['coupling_voltage_kV'] = from_voltage[pos]
 
     # --- 7. Consolidate Results ---
     topology_data = df_iconnect.to_dict(orient='records')
@@ -167,3 +190,62 @@ def analyze_topology(file_content: bytes, filename: str) -> dict:
         "coupling_analysis": coupling_info,
         "incomer_breaker_analysis": incomer_breaker_info
     }
+
+def filter_analysis(result: dict, analysis_types=None) -> dict:
+    """Keeps status/message/topology and the requested '<type>_analysis' lists (missing ones as [])."""
+    if not analysis_types: return result
+    filtered = {key: val for key, val in result.items() if key.replace('_analysis', '') in analysis_types or key in ['status', 'message', 'topology']}
+    for atype in analysis_types:
+        if f'{atype}_analysis' not in filtered:
+            filtered[f'{atype}_analysis'] = []
+    return filtered
+
+def result_path(file_content: bytes, filename: str, suffix: str = "json", digest: str = None) -> str:
+    """
+    Cache file of this content for `filename`'s extension (analysis result, diagram details...).
+    `digest`: content digest already known (e.g. parse_cache.path_digest), `file_content` is then not hashed.
+    """
+    ext = "".join(c for c in filename.lower().split('.')[-1] if c.isalnum())
+    return os.path.join(RESULT_CACHE_DIR, digest or parse_cache.content_digest(file_content), f"v{RESULT_VERSION}-{ext}.{suffix}")
+
+def write_cache_file(path: str, payload: str):
+    """Atomic write (temp file + rename) of one cache file, then LRU eviction down to the budget."""
+    tmp = f"{path}.tmp-{uuid.uuid4().hex}"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, "w", encoding="utf-8") as f: f.write(payload)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"[TopologyCache] Store failed for {path}: {e}")
+        if os.path.exists(tmp): os.remove(tmp)
+        return
+    parse_cache.enforce_budget(RESULT_CACHE_DIR, RESULT_CACHE_MAX_MB)
+
+def _store_result(path: str, result: dict):
+    try:
+        # [decision:logic] Strict JSON only (no default=str): an entry must load back exactly as computed.
+        payload = json.dumps(result)
+    except (TypeError, ValueError):
+        return
+    write_cache_file(path, payload)
+
+def analyze_topology_cached(file_content: bytes, filename: str) -> dict:
+    """
+    analyze_topology() served from the result cache when this content was already analyzed.
+    Each call returns a fresh dict, so callers are free to mutate it.
+    """
+    if RESULT_CACHE_MAX_MB <= 0: return analyze_topology(file_content, filename)
+    path = result_path(file_content, filename)
+    try:
+        with open(path, "r", encoding="utf-8") as f: result = json.load(f)
+        # LRU bookkeeping: the entry folder mtime is the last access time.
+        os.utime(os.path.dirname(path), None)
+        return result
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"[TopologyCache] Unreadable entry {path}: {e}")
+
+    result = analyze_topology(file_content, filename)
+    if result.get("status") == "success": _store_result(path, result)
+    return result
@@ -0,0 +1,52 @@
+import os
+import threading
+from typing import Dict, Optional, Callable, Iterator, Tuple
+from app.calculations import db_converter
+
+class WorkspaceContext:
+    """
+    Per-request view of a workspace.
+    Each database file is opened (and each table parsed) at most once, then shared by
+    every consumer of the request: transformer map, topology resolution, ANSI calculations.
+    """
+    def __init__(self, files: Dict[str, bytes], base_dir: Optional[str] = None, tables=None):
+        self.files = files
+        self.base_dir = base_dir
+        self.tables_spec = tables
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def get_tables(self, fname: str):
+        """Lazy {table: DataFrame} mapping of one file (None if unreadable). Opened once per request."""
+        with self._lock:
+            if fname not in self._tables:
+                content = self.files.get(fname)
+                source_path = os.path.join(self.base_dir, fname) if self.base_dir else None
+                if source_path and not os.path.isfile(source_path): source_path = None
+                if content is None and source_path is None: self._tables[fname] = None
+                else: self._tables[fname] = db_converter.open_tables(content, source_path, self.tables_spec)
+            return self._tables[fname]
+
+    def iter_tables(self, predicate: Callable[[str], bool]) -> Iterator[Tuple[str, object]]:
+        """Yields (filename, tables) for every readable file accepted by `predicate`."""
+        for fname in self.files:
+            if not predicate(fname): continue
+            dfs = self.get_tables(fname)
+            if dfs is not None: yield fname, dfs
+
+    def close(self):
+        with self._lock:
+            for dfs in self._tables.values():
+                if dfs is not None: dfs.close()
+            self._tables = {}
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+def as_context(files, tables=None) -> Tuple[WorkspaceContext, bool]:
+    """
+    Accepts either a WorkspaceContext or a raw {filename: bytes} dict.
+    Returns (context, owned): `owned` is True when the caller created it and must close it.
+    """
+    if isinstance(files, WorkspaceContext): return files, False
+    return WorkspaceContext(files, tables=tables), True
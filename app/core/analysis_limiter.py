@@ -0,0 +1,111 @@
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+
+# --- CONFIGURATION ---
+# MAX_CONCURRENT_ANALYSES : analyses running at the same time (executor threads)
+# MAX_QUEUED_ANALYSES : analyses allowed to wait for a free slot before we answer 503
+MAX_CONCURRENT_ANALYSES = int(os.getenv("MAX_CONCURRENT_ANALYSES", "2"))
+MAX_QUEUED_ANALYSES = int(os.getenv("MAX_QUEUED_ANALYSES", "8"))
+
+class AnalysisLimiter:
+    """
+    Runs CPU-bound analysis bodies (pandas / sqlite) outside the asyncio event loop,
+    so /health, chat and file listing stay responsive while an analysis runs.
+    Admission control: at most `max_running` analyses execute, `max_queued` more wait
+    in the executor queue, anything beyond is rejected with 503.
+    """
+    def __init__(self, max_running: int, max_queued: int):
+        self.max_running = max(1, max_running)
+        self.max_queued = max(0, max_queued)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_running, thread_name_prefix="analysis")
+        self._admitted = 0
+        self._lock = threading.Lock()
+
+    def _admit(self):
+        with self._lock:
+            if self._admitted >= self.max_running + self.max_queued:
+                raise HTTPException(status_code=503, detail="Server busy: too many analyses in progress. Retry later.",
+                                    headers={"Retry-After": "10"})
+            self._admitted += 1
+
+    def _release(self):
+        with self._lock: self._admitted -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"admitted": self._admitted, "running_max": self.max_running, "queue_max": self.max_queued}
+
+    async def run(self, func, *args, **kwargs):
+        """await analysis_limiter.run(func, ...) : func runs in the analysis executor."""
+        self._admit()
+        try:
+            future = self._executor.submit(functools.partial(func, *args, **kwargs))
+        except BaseException:
+            self._release()
+            raise
+        # [!] Released when the work ends, not when the caller stops waiting: a client that disconnects
+        # cancels the await, but a started analysis keeps its thread (and its slot) until it returns.
+        future.add_done_callback(lambda _: self._release())
+        return await asyncio.wrap_future(future)
+
+    def stream(self, gen_func, *args, **kwargs):
+        """
+        Streaming variant: the sync generator gen_func(...) is advanced in the analysis executor and its
+        items are re-yielded asynchronously. Admission happens now (so a 503 can still be sent before the
+        response starts); the slot is released when the stream ends, is closed, or is dropped unstarted.
+        """
+        self._admit()
+        loop = asyncio.get_running_loop()
+        done = object()
+
+        async def agen():
+            gen = None
+            try:
+                gen = await loop.run_in_executor(self._executor, functools.partial(gen_func, *args, **kwargs))
+                while True:
+                    item = await loop.run_in_executor(self._executor, next, gen, done)
+                    if item is done: break
+                    yield item
+            finally:
+                if gen is not None: await loop.run_in_executor(self._executor, gen.close)
+        return _AdmittedStream(self, agen())
+
+class _AdmittedStream:
+    """
+    Async iterator holding one limiter slot. The finally of an async generator only runs once it has
+    been started: a response dropped before its first item (client gone, send error) would leak the slot.
+    Here the slot is released exactly once, at the end of iteration, on aclose() or when the object is freed.
+    """
+    def __init__(self, limiter: AnalysisLimiter, agen):
+        self._limiter = limiter
+        self._agen = agen
+        self._released = False
+
+    def _release_once(self):
+        if not self._released:
+            self._released = True
+            self._limiter._release()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self._agen.__anext__()
+        except BaseException:
+            # StopAsyncIteration, error or cancellation: the generator is finished
+            self._release_once()
+            raise
+
+    async def aclose(self):
+        try: await self._agen.aclose()
+        finally: self._release_once()
+
+    def __del__(self):
+        self._release_once()
+
+analysis_limiter = AnalysisLimiter(MAX_CONCURRENT_ANALYSES, MAX_QUEUED_ANALYSES)
@@ -0,0 +1,201 @@
+import os
+import json
+import uuid
+import threading
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import func
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+
+from ..database import SessionLocal
+from ..models import Job
+
+# --- CONFIGURATION ---
+# JOB_WORKERS : jobs executed at the same time (the per-file fan-out still uses the batch process pool)
+# JOB_LEASE_SECONDS : a running job whose heartbeat is older than this is considered orphaned
+#                     (its process died) and is put back in the queue
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+
+# kind -> runner(target_path, params, progress) -> dict (archive location / summary)
+_RUNNERS: Dict[str, Callable] = {}
+
+def register(kind: str):
+    """Decorator: declares the runner of a job kind."""
+    def deco(func):
+        _RUNNERS[kind] = func
+        return func
+    return deco
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+class JobProgress:
+    """
+    Per-file progress of one job, persisted in the jobs table on every change
+    (one row update per file: cheap next to the analysis itself).
+    """
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.files: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def start(self, filenames: List[str]):
+        with self._lock:
+            for f in filenames: self.files.setdefault(f, "queued")
+            self._flush()
+
+    def __call__(self, filename: str, state: str):
+        with self._lock:
+            self.files[filename] = state
+            self._flush()
+
+    def _flush(self):
+        db = SessionLocal()
+        try:
+            job = db.query(Job).filter(Job.id == self.job_id).first()
+            if not job: return
+            job.progress = json.dumps(self.files)
+            job.files_total = len(self.files)
+            job.files_done = sum(1 for s in self.files.values() if s in ("done", "failed"))
+            db.commit()
+        finally:
+            db.close()
+
+class JobQueue:
+    """
+    Local background job runner: job state lives in SQLite (jobs table), execution in a
+    bounded thread pool. No broker: several processes may share the table, a job is claimed
+    with a conditional update and kept by a heartbeat; recover() re-queues expired leases.
+    """
+    def __init__(self, workers: int):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="job")
+        self._reaper = None
+        self._offered = set() # ids sitting in this process' executor queue
+        self._offered_lock = threading.Lock()
+
+    def _offer(self, job_id: str):
+        with self._offered_lock:
+            if job_id in self._offered: return
+            self._offered.add(job_id)
+        self._executor.submit(self._execute, job_id)
+
+    def submit(self, db, kind: str, target_path: str, owner_uid: str,
+               project_id: Optional[str] = None, params: Optional[dict] = None) -> Job:
+        if kind not in _RUNNERS: raise HTTPException(400, f"Unknown job kind '{kind}'")
+        job = Job(id=uuid.uuid4().hex, kind=kind, status="queued", owner_uid=owner_uid,
+                  project_id=project_id, target_path=target_path, params=json.dumps(params or {}))
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        self._offer(job.id)
+        return job
+
+    def _set(self, job_id: str, **fields):
+        db = SessionLocal()
+        try:
+            job = db.query(Job).filter(Job.id == job_id).first()
+            if not job: return None
+            for k, v in fields.items(): setattr(job, k, v)
+            db.commit()
+            return job
+        finally:
+            db.close()
+
+    def _claim(self, job_id: str) -> Optional[Job]:
+        """queued -> running in one conditional UPDATE: of all the workers / processes trying, one wins."""
+        db = SessionLocal()
+        try:
+            now = _now()
+            claimed = db.query(Job).filter(Job.id == job_id, Job.status == "queued").update(
+                {"status": "running", "started_at": now, "heartbeat_at": now}, synchronize_session=False)
+            db.commit()
+            if claimed != 1: return None
+            job = db.query(Job).filter(Job.id == job_id).first()
+            db.expunge(job)
+            return job
+        finally:
+            db.close()
+
+    def _heartbeat(self, job_id: str, stop: threading.Event):
+        while not stop.wait(JOB_LEASE_SECONDS / 3):
+            db = SessionLocal()
+            try:
+                db.query(Job).filter(Job.id == job_id, Job.status == "running").update(
+                    {"heartbeat_at": _now()}, synchronize_session=False)
+                db.commit()
+            except Exception as e:
+                print(f"[Jobs] Heartbeat failed for {job_id}: {e}")
+            finally:
+                db.close()
+
+    def _execute(self, job_id: str):
+        with self._offered_lock: self._offered.discard(job_id)
+        job = self._claim(job_id)
+        if job is None: return
+        kind, target_path, params = job.kind, job.target_path, json.loads(job.params or "{}")
+
+        print(f"[Jobs] {kind} {job_id} started")
+        stop = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job_id, stop), daemon=True, name=f"job-heartbeat-{job_id[:8]}").start()
+        try:
+            result = _RUNNERS[kind](target_path, params, JobProgress(job_id))
+            self._set(job_id, status="done", finished_at=_now(), result=json.dumps(jsonable_encoder(result)))
+            print(f"[Jobs] {kind} {job_id} done")
+        except HTTPException as e:
+            self._set(job_id, status="failed", finished_at=_now(), error=str(e.detail))
+        except Exception as e:
+            print(f"[Jobs] {kind} {job_id} failed: {e}")
+            self._set(job_id, status="failed", finished_at=_now(), error=str(e))
+        finally:
+            stop.set()
+
+    def recover(self):
+        """
+        Startup, then every JOB_LEASE_SECONDS: running jobs whose lease expired (their process died)
+        go back to 'queued', and queued jobs are offered to this process' workers (the claim decides
+        which process runs them). Jobs still heartbeating in another process are left alone.
+        """
+        db = SessionLocal()
+        try:
+            cutoff = _now() - datetime.timedelta(seconds=JOB_LEASE_SECONDS)
+            last_seen = func.coalesce(Job.heartbeat_at, Job.started_at, Job.created_at)
+            expired = db.query(Job).filter(Job.status == "running", last_seen < cutoff).update(
+                {"status": "queued", "started_at": None, "heartbeat_at": None, "progress": None, "files_done": 0},
+                synchronize_session=False)
+            db.commit()
+            ids = [j.id for j in db.query(Job.id).filter(Job.status == "queued").order_by(Job.created_at).all()]
+        except Exception as e:
+            print(f"[Jobs] Recovery skipped: {e}")
+            expired, ids = 0, []
+        finally:
+            db.close()
+        for job_id in ids: self._offer(job_id)
+        if expired: print(f"[Jobs] {expired} orphaned job(s) re-queued")
+        self._schedule_recovery()
+
+    def _schedule_recovery(self):
+        self._reaper = threading.Timer(JOB_LEASE_SECONDS, self.recover)
+        self._reaper.daemon = True
+        self._reaper.start()
+
+def job_to_dict(job: Job) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "project_id": job.project_id,
+        "files_total": job.files_total or 0,
+        "files_done": job.files_done or 0,
+        "progress": json.loads(job.progress) if job.progress else {},
+        "params": json.loads(job.params) if job.params else {},
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+job_queue = JobQueue(JOB_WORKERS)
@@ -1,5 +1,9 @@
 
 import os
+import json
+import gzip
+import datetime
+from fastapi.encoders import jsonable_encoder
 from typing import Optional
 from sqlalchemy.orm import Session
 from ..models import User
@@ -29,3 +33,29 @@ def get_target_path(user: User, project_id: Optional[str], db: Session, action:
         os.makedirs(target_dir, exist_ok=True)
         
     return target_dir
+
+def save_json_result(target_dir: str, folder: str, safe_basename: str, payload, compact: bool = False, compress: bool = False) -> dict:
+    """
+    Archives `payload` as <target_dir>/<folder>/<safe_basename>_<timestamp>.json
+    (loadflow_results, topology_results, ...) and returns its location.
+    compact=True drops the pretty-printing, compress=True writes a gzip file (.json.gz).
+    """
+    archive_dir = os.path.join(target_dir, folder)
+    if not os.path.exists(archive_dir):
+        os.makedirs(archive_dir, exist_ok=True)
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"{safe_basename}_{timestamp}.json" + (".gz" if compress else "")
+    output_path = os.path.join(archive_dir, filename)
+
+    layout = {"separators": (",", ":")} if compact else {"indent": 2}
+    opener = gzip.open if compress else open
+    with opener(output_path, "wt", encoding="utf-8") as f:
+        json.dump(jsonable_encoder(payload), f, default=str, **layout)
+
+    return {
+        "status": "saved",
+        "folder": folder,
+        "filename": filename,
+        "full_path": f"/{folder}/{filename}"
+    }
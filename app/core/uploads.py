@@ -0,0 +1,308 @@
+import os
+import json
+import time
+import uuid
+import errno
+import shutil
+import hashlib
+import zipfile
+from typing import AsyncIterator, Callable, Optional
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+# --- CONFIGURATION ---
+# UPLOAD_CHUNK_SIZE : bytes read / written at a time (the upload never sits in memory as a whole)
+# UPLOAD_SESSION_TTL_HOURS : an unfinished chunked upload is discarded after this delay
+# UPLOAD_ENFORCE_MAX_MB : opt-in (off by default) per-file size limit from the quota's 'max_mb'
+# UPLOAD_STAGING_DIR : partial uploads, one folder per user (outside STORAGE_ROOT)
+# UPLOAD_MAX_SESSIONS : chunked uploads a user may have open at the same time
+# UPLOAD_MAX_STAGED_MB : bytes a user may have in staging (parts + temp files), -1 = unlimited
+# UPLOAD_MAX_EXTRACTED_MB : decompressed bytes one uploaded zip may write (always on: zip bombs), -1 = unlimited
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+UPLOAD_SESSION_TTL_HOURS = float(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24"))
+UPLOAD_ENFORCE_MAX_MB = os.getenv("UPLOAD_ENFORCE_MAX_MB", "false").lower() in ("1", "true", "yes")
+UPLOAD_STAGING_DIR = os.getenv("UPLOAD_STAGING_DIR", "/app/uploads")
+UPLOAD_MAX_SESSIONS = int(os.getenv("UPLOAD_MAX_SESSIONS", "4"))
+UPLOAD_MAX_STAGED_MB = float(os.getenv("UPLOAD_MAX_STAGED_MB", "2048"))
+UPLOAD_MAX_EXTRACTED_MB = float(os.getenv("UPLOAD_MAX_EXTRACTED_MB", "2048"))
+
+# [structure:storage] Partial files never sit in a workspace: they would be counted (guest_guard counts every
+# file) or escape the quotas (dot entries are skipped by count_files_recursive), and STORAGE_ROOT only holds
+# workspaces (storage_admin audit). A finished file is moved into the workspace by publish().
+TMP_PREFIX = ".upload-"
+SESSIONS_DIR = "sessions"
+
+def max_upload_bytes(quota: dict) -> Optional[int]:
+    """Largest accepted file for this quota ('max_mb', -1 = unlimited). None unless UPLOAD_ENFORCE_MAX_MB is set."""
+    if not UPLOAD_ENFORCE_MAX_MB: return None
+    max_mb = quota.get("max_mb", -1)
+    return None if max_mb is None or max_mb < 0 else int(max_mb * 1024 * 1024)
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"File too large. Limit: {max_bytes // (1024 * 1024)} MB per file.")
+
+# --- STAGING (per user) ---
+
+def staging_dir(owner_uid: str) -> str:
+    safe = "".join(c for c in str(owner_uid) if c.isalnum() or c in "-_") or "anonymous"
+    path = os.path.join(UPLOAD_STAGING_DIR, safe)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try: total += os.path.getsize(os.path.join(root, f))
+            except OSError: pass
+    return total
+
+def staging_left(owner_uid: str) -> Optional[int]:
+    """Bytes this user may still stage (None = unlimited)."""
+    if UPLOAD_MAX_STAGED_MB < 0: return None
+    return max(0, int(UPLOAD_MAX_STAGED_MB * 1024 * 1024) - _dir_bytes(staging_dir(owner_uid)))
+
+def _staging_full() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Too much upload data in progress (limit: {UPLOAD_MAX_STAGED_MB:g} MB). Complete or abort your pending uploads.")
+
+def publish(tmp_path: str, dest_path: str):
+    """Moves a finished temp file to its final name in the workspace (atomic: the file appears complete or not at all)."""
+    try:
+        os.replace(tmp_path, dest_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV: raise
+        # Staging on another filesystem than the workspace: copy next to the destination, then rename
+        part = os.path.join(os.path.dirname(dest_path), f"{TMP_PREFIX}{uuid.uuid4().hex}.part")
+        try:
+            shutil.copyfile(tmp_path, part)
+            os.replace(part, dest_path)
+        except BaseException:
+            if os.path.exists(part): os.remove(part)
+            raise
+        os.remove(tmp_path)
+
+class StreamedFile:
+    """Temp file being written chunk by chunk, with its running size and SHA-256."""
+    def __init__(self, folder: str, max_bytes: Optional[int] = None, start_size: int = 0, budget: Optional[int] = None):
+        self.path = os.path.join(folder, f"{TMP_PREFIX}{uuid.uuid4().hex}.part")
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.start_size = start_size # bytes already accepted elsewhere (previous parts)
+        self.budget = budget # staging bytes left for this user
+        self._hash = hashlib.sha256()
+        self._f = open(self.path, "wb")
+
+    def _write(self, chunk: bytes):
+        self._f.write(chunk)
+
+    async def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.max_bytes is not None and self.start_size + self.size > self.max_bytes:
+            raise _too_large(self.max_bytes)
+        if self.budget is not None and self.size > self.budget: raise _staging_full()
+        self._hash.update(chunk)
+        await run_in_threadpool(self._write, chunk)
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    def close(self):
+        if not self._f.closed: self._f.close()
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.path): os.remove(self.path)
+
+async def stream_to_temp(chunks: AsyncIterator[bytes], owner_uid: str, max_bytes: Optional[int] = None, start_size: int = 0,
+                         budget_bonus: int = 0) -> StreamedFile:
+    """
+    Copies an async byte stream into a temp file of the user's staging folder (per-file limit, staging
+    budget and hash checked as bytes flow). `budget_bonus`: staged bytes this file replaces.
+    """
+    left = staging_left(owner_uid)
+    out = StreamedFile(staging_dir(owner_uid), max_bytes, start_size, None if left is None else left + budget_bonus)
+    try:
+        async for chunk in chunks:
+            if chunk: await out.write(chunk)
+        out.close()
+        return out
+    except BaseException:
+        out.discard()
+        raise
+
+async def iter_upload(upload) -> AsyncIterator[bytes]:
+    """Chunks of a starlette UploadFile."""
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk: break
+        yield chunk
+
+# --- RESUMABLE / CHUNKED UPLOADS ---
+# [?] [THOUGHT] initiate -> PUT part n (any order, re-sendable) -> complete. Each part is its own file,
+# so an interrupted part is simply uploaded again; complete() concatenates them into one temp file.
+# Sessions belong to their user (staging folder) and to the workspace they were opened for.
+
+def _sessions_root(owner_uid: str) -> str:
+    return os.path.join(staging_dir(owner_uid), SESSIONS_DIR)
+
+def session_dir(owner_uid: str, upload_id: str) -> str:
+    if not upload_id.isalnum(): raise HTTPException(status_code=404, detail="Upload not found.")
+    return os.path.join(_sessions_root(owner_uid), upload_id)
+
+def _meta_path(folder: str) -> str:
+    return os.path.join(folder, "meta.json")
+
+def _part_path(folder: str, part: int) -> str:
+    return os.path.join(folder, f"part-{part:06d}")
+
+def purge_stale_staging():
+    """Drops the sessions and orphan temp files (crashed worker) of every user older than the TTL."""
+    if not os.path.isdir(UPLOAD_STAGING_DIR): return
+    limit = time.time() - UPLOAD_SESSION_TTL_HOURS * 3600
+    for user_dir in os.scandir(UPLOAD_STAGING_DIR):
+        if not user_dir.is_dir(): continue
+        sessions = os.path.join(user_dir.path, SESSIONS_DIR)
+        if os.path.isdir(sessions):
+            for entry in os.scandir(sessions):
+                try:
+                    if entry.is_dir() and entry.stat().st_mtime < limit: shutil.rmtree(entry.path, ignore_errors=True)
+                except OSError: pass
+        for entry in os.scandir(user_dir.path):
+            try:
+                if entry.name.startswith(TMP_PREFIX) and entry.stat().st_mtime < limit: os.remove(entry.path)
+            except OSError: pass
+
+def open_sessions(owner_uid: str) -> int:
+    root = _sessions_root(owner_uid)
+    return sum(1 for e in os.scandir(root) if e.is_dir()) if os.path.isdir(root) else 0
+
+def create_session(target_dir: str, owner_uid: str, filename: str, size: Optional[int], sha256: Optional[str]) -> dict:
+    purge_stale_staging()
+    if open_sessions(owner_uid) >= UPLOAD_MAX_SESSIONS:
+        raise HTTPException(status_code=429, detail=f"Too many uploads in progress (limit: {UPLOAD_MAX_SESSIONS}). Complete or abort one first.")
+    left = staging_left(owner_uid)
+    if size is not None and left is not None and size > left: raise _staging_full()
+    meta = {
+        "upload_id": uuid.uuid4().hex, "owner_uid": owner_uid, "target_dir": os.path.abspath(target_dir),
+        "filename": filename, "size": size, "sha256": sha256.lower() if sha256 else None, "created_at": time.time(),
+    }
+    folder = session_dir(owner_uid, meta["upload_id"])
+    os.makedirs(folder, exist_ok=True)
+    with open(_meta_path(folder), "w", encoding="utf-8") as f: json.dump(meta, f)
+    return meta
+
+def load_session(target_dir: str, upload_id: str, owner_uid: str) -> dict:
+    folder = session_dir(owner_uid, upload_id)
+    try:
+        with open(_meta_path(folder), "r", encoding="utf-8") as f: meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        raise HTTPException(status_code=404, detail="Upload not found.")
+    if meta.get("owner_uid") != owner_uid or meta.get("target_dir") != os.path.abspath(target_dir):
+        raise HTTPException(status_code=404, detail="Upload not found.")
+    return meta
+
+def list_parts(owner_uid: str, upload_id: str) -> dict:
+    """{part number: size} of the parts received so far."""
+    folder = session_dir(owner_uid, upload_id)
+    parts = {}
+    for name in os.listdir(folder):
+        if name.startswith("part-"): parts[int(name[5:])] = os.path.getsize(os.path.join(folder, name))
+    return dict(sorted(parts.items()))
+
+async def store_part(meta: dict, part: int, chunks: AsyncIterator[bytes], max_bytes: Optional[int]) -> dict:
+    """Streams one part to the staging folder; the whole session is checked against the per-file limit."""
+    if part < 1: raise HTTPException(status_code=400, detail="Part numbers start at 1.")
+    owner = meta["owner_uid"]
+    folder = session_dir(owner, meta["upload_id"])
+    parts = list_parts(owner, meta["upload_id"])
+    others = sum(size for n, size in parts.items() if n != part)
+    # A re-sent part replaces the previous one: its bytes are given back to the staging budget
+    out = await stream_to_temp(chunks, owner, max_bytes, start_size=others, budget_bonus=parts.get(part, 0))
+    os.replace(out.path, _part_path(folder, part))
+    os.utime(folder, None) # TTL counts from the last activity
+    return {"part": part, "size": out.size, "sha256": out.sha256}
+
+def assemble_session(meta: dict, max_bytes: Optional[int]) -> dict:
+    """Concatenates the parts into one temp file of the staging folder and checks the declared size / hash."""
+    owner = meta["owner_uid"]
+    folder = session_dir(owner, meta["upload_id"])
+    parts = list_parts(owner, meta["upload_id"])
+    if not parts: raise HTTPException(status_code=400, detail="No part received.")
+    missing = sorted(set(range(1, max(parts) + 1)) - set(parts))
+    if missing: raise HTTPException(status_code=400, detail=f"Missing parts: {missing[:20]}")
+
+    tmp_path = os.path.join(staging_dir(owner), f"{TMP_PREFIX}{uuid.uuid4().hex}.part")
+    digest, size = hashlib.sha256(), 0
+    try:
+        with open(tmp_path, "wb") as out:
+            for part in parts:
+                with open(_part_path(folder, part), "rb") as f:
+                    for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+                        size += len(chunk)
+                        if max_bytes is not None and size > max_bytes: raise _too_large(max_bytes)
+                        digest.update(chunk); out.write(chunk)
+        if meta.get("size") is not None and size != meta["size"]:
+            raise HTTPException(status_code=400, detail=f"Size mismatch: expected {meta['size']} bytes, received {size}.")
+        if meta.get("sha256") and digest.hexdigest() != meta["sha256"]:
+            raise HTTPException(status_code=400, detail="SHA-256 mismatch: the upload is corrupted, re-send the parts.")
+    except BaseException:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+        raise
+    return {"path": tmp_path, "size": size, "sha256": digest.hexdigest()}
+
+def drop_session(owner_uid: str, upload_id: str):
+    shutil.rmtree(session_dir(owner_uid, upload_id), ignore_errors=True)
+
+# --- ZIP EXTRACTION ---
+# [+] [INFO] Entry by entry from the received temp file (never the whole archive in memory), run off the
+# event loop by the caller. Quotas are checked on the real decompressed bytes, not the declared sizes.
+
+def _entry_path(dest_dir: str, name: str) -> Optional[str]:
+    # [!] Zip-slip: absolute names and '..' components are dropped, like ZipFile.extractall does.
+    parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".", "..")]
+    if not parts: return None
+    path = os.path.join(dest_dir, *parts)
+    return path if os.path.abspath(path).startswith(os.path.abspath(dest_dir) + os.sep) else None
+
+def max_extracted_bytes() -> Optional[int]:
+    return None if UPLOAD_MAX_EXTRACTED_MB < 0 else int(UPLOAD_MAX_EXTRACTED_MB * 1024 * 1024)
+
+def _archive_too_large(max_total: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Archive too large once extracted. Limit: {max_total // (1024 * 1024)} MB.")
+
+def extract_zip(zip_path: str, dest_dir: str, max_files: Optional[int] = None, max_bytes: Optional[int] = None,
+                on_file: Optional[Callable[[str], None]] = None) -> int:
+    """
+    Extracts `zip_path` into `dest_dir` and returns the number of files written.
+    `max_files`: files this archive may still add, `max_bytes`: per-file limit (None = unlimited).
+    The whole archive is also bounded by UPLOAD_MAX_EXTRACTED_MB of written bytes.
+    `on_file(path)` is called as each file lands. Raises BadZipFile, or HTTPException on a quota breach.
+    """
+    written, total = 0, 0
+    max_total = max_extracted_bytes()
+    with zipfile.ZipFile(zip_path) as z:
+        for info in z.infolist():
+            path = _entry_path(dest_dir, info.filename)
+            if path is None: continue
+            if info.is_dir():
+                os.makedirs(path, exist_ok=True); continue
+            if max_files is not None and written + 1 > max_files:
+                raise HTTPException(status_code=403, detail=f"Quota exceeded: the archive holds more files than the {max_files} still allowed.")
+            if max_bytes is not None and info.file_size > max_bytes: raise _too_large(max_bytes)
+            if max_total is not None and total + info.file_size > max_total: raise _archive_too_large(max_total)
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            size = 0
+            with z.open(info) as src, open(path, "wb") as out:
+                for chunk in iter(lambda: src.read(UPLOAD_CHUNK_SIZE), b""):
+                    size += len(chunk); total += len(chunk)
+                    if max_bytes is not None and size > max_bytes: raise _too_large(max_bytes)
+                    # Declared sizes can lie: the real bytes are what fill the volume
+                    if max_total is not None and total > max_total: raise _archive_too_large(max_total)
+                    out.write(chunk)
+            written += 1
+            if on_file:
+                try: on_file(path)
+                except Exception as e: print(f"[Upload] Post-processing failed for {info.filename}: {e}")
+    return written
@@ -0,0 +1,88 @@
+import time
+import zipfile
+from typing import Iterable, Iterator, Tuple
+
+# --- CONFIGURATION ---
+ZIP_CHUNK_SIZE = 1024 * 1024
+# Already compressed formats: deflating them again costs CPU for nothing
+STORED_EXTENSIONS = ('.zip', '.gz', '.tgz', '.7z', '.rar', '.xz', '.bz2',
+                     '.png', '.jpg', '.jpeg', '.gif', '.webp', '.pdf',
+                     '.xlsx', '.docx', '.pptx', '.parquet')
+
+class _ChunkSink:
+    """
+    Write-only, non-seekable file object for ZipFile: collects what the writer produced
+    until the generator hands it to the response (zipfile then uses data descriptors).
+    """
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def write(self, data) -> int:
+        if data:
+            self._chunks.append(bytes(data))
+            self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def _compression(arcname: str, store_only: bool) -> int:
+    if store_only or arcname.lower().endswith(STORED_EXTENSIONS): return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+def _entry_chunks(zf: zipfile.ZipFile, sink: _ChunkSink, info: zipfile.ZipInfo, chunks: Iterable[bytes]) -> Iterator[bytes]:
+    with zf.open(info, "w", force_zip64=info.file_size > zipfile.ZIP64_LIMIT) as dest:
+        for chunk in chunks:
+            dest.write(chunk)
+            data = sink.drain()
+            if data: yield data
+
+def stream_zip(entries: Iterable[Tuple[str, str]], store_only: bool = False) -> Iterator[bytes]:
+    """
+    Yields a ZIP archive of `entries` ((path on disk, name in the archive)) chunk by chunk:
+    each file is read, compressed and sent piece by piece, the archive is never built in memory.
+    store_only=True disables compression (already compressed content).
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", allowZip64=True) as zf:
+        for path, arcname in entries:
+            try:
+                info = zipfile.ZipInfo.from_file(path, arcname)
+                info.compress_type = _compression(arcname, store_only)
+                with open(path, "rb") as src:
+                    yield from _entry_chunks(zf, sink, info, iter(lambda: src.read(ZIP_CHUNK_SIZE), b""))
+            except OSError as e:
+                # A file deleted / unreadable during the download is skipped, the archive stays valid
+                print(f"[ZipStream] Skipped {arcname}: {e}")
+            data = sink.drain()
+            if data: yield data
+    data = sink.drain() # central directory
+    if data: yield data
+
+def stream_zip_data(entries: Iterable[Tuple[str, bytes]], store_only: bool = False) -> Iterator[bytes]:
+    """
+    Same as stream_zip for content produced on the fly ((name in the archive, bytes)): each entry is
+    written and sent as soon as the iterator hands it over, then released.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", allowZip64=True) as zf:
+        for arcname, content in entries:
+            info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+            info.compress_type = _compression(arcname, store_only)
+            info.file_size = len(content)
+            info.external_attr = 0o600 << 16 # same as ZipFile.writestr
+            view = memoryview(content)
+            yield from _entry_chunks(zf, sink, info, (view[i:i + ZIP_CHUNK_SIZE] for i in range(0, len(view), ZIP_CHUNK_SIZE)))
+            data = sink.drain()
+            if data: yield data
+    data = sink.drain() # central directory
+    if data: yield data
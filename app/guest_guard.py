@@ -17,7 +17,8 @@ def check_guest_restrictions(uid: str, is_guest: bool, action: str) -> str:
         raise HTTPException(403, "Guests cannot create projects.")
 
     if action == "upload":
-        files = [f for f in os.listdir(user_path) if os.path.isfile(os.path.join(user_path, f))]
+        # Dot entries (in-flight publish copies...) are not user files, as in count_files_recursive
+        files = [f for f in os.listdir(user_path) if not f.startswith('.') and os.path.isfile(os.path.join(user_path, f))]
         if len(files) >= 10:
             raise HTTPException(403, "Guest Quota Reached (Max 10 files).")
             
@@ -33,6 +33,9 @@ def run_migrations():
             # Projects
             try: connection.execute(text("ALTER TABLE projects ADD COLUMN owner_id VARCHAR"))
             except: pass
+            # Jobs (lease of the running process)
+            try: connection.execute(text("ALTER TABLE jobs ADD COLUMN heartbeat_at DATETIME"))
+            except: pass
             # Cleanup
             try: connection.execute(text("UPDATE users SET is_active = 1 WHERE is_active IS NULL"))
             except: pass
@@ -49,8 +52,20 @@ try:
 except ImportError:
     ingestion = loadflow = protection = inrush = extraction = None
 
+# [decision:logic] Own guard: a broken job queue must not take the analysis routers down with it
+try:
+    from .routers import jobs
+except ImportError as e:
+    print(f"⚠️ Jobs router disabled: {e}")
+    jobs = None
+
 Base.metadata.create_all(bind=engine)
 
+# [+] [INFO] Background jobs whose process died (lease expired) go back in the queue
+if jobs:
+    from .core.job_queue import job_queue
+    job_queue.recover()
+
 app = FastAPI(title="Solufuse API", version="2.9.3")
 
 app.add_middleware(
@@ -77,6 +92,13 @@ if loadflow: app.include_router(loadflow.router)
 if protection: app.include_router(protection.router)
 if inrush: app.include_router(inrush.router)
 if extraction: app.include_router(extraction.router)
+if jobs: app.include_router(jobs.router)
+
+# [+] [INFO] Batch process pool started with the app when BATCH_WARM_UP=1 (otherwise by the first batch)
+@app.on_event("startup")
+def warm_batch_pool():
+    from .calculations import batch_engine
+    batch_engine.warm_up()
 
 @app.get("/")
 def read_root(): return {"status": "Online", "version": "2.9.3"}
@@ -70,3 +70,27 @@ class Message(Base):
 
     author = relationship("User", back_populates="messages")
     project = relationship("Project", back_populates="messages")
+
+# [+] [NEW] BACKGROUND JOBS (loadflow / topology / protection batches)
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(String, primary_key=True, index=True) # uuid4 hex
+    kind = Column(String, index=True) # loadflow | topology | protection
+    status = Column(String, default="queued", index=True) # queued | running | done | failed
+
+    owner_uid = Column(String, index=True) # firebase_uid of the submitter
+    project_id = Column(String, nullable=True)
+    target_path = Column(String) # Storage folder resolved at submit time
+
+    params = Column(Text, nullable=True) # JSON
+    progress = Column(Text, nullable=True) # JSON {filename: queued|running|done|failed}
+    files_total = Column(Integer, default=0)
+    files_done = Column(Integer, default=0)
+    result = Column(Text, nullable=True) # JSON (archive location...)
+    error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True) # Refreshed by the process running the job (lease)
@@ -8,11 +8,13 @@ from fastapi.responses import StreamingResponse, JSONResponse
 from sqlalchemy.orm import Session
 
 from app.schemas.protection import ProjectConfig
-from app.calculations.ansi_code import ansi_51
+from app.calculations.ansi_code import ansi_51, run_function_for_file
 from app.calculations.ansi_code import common as common_lib
-from app.calculations import db_converter, topology_manager
+from app.calculations import batch_engine
+from app.calculations.workspace import WorkspaceContext
 from app.calculations.file_utils import is_protection_file
 
+from ..core.analysis_limiter import analysis_limiter
 from ..database import get_db
 from ..auth import get_current_user, ProjectAccessChecker
 from ..guest_guard import check_guest_restrictions
@@ -56,41 +58,38 @@ def get_config_from_files(files: Dict[str, bytes]) -> ProjectConfig:
     except Exception as e: raise HTTPException(422, f"Invalid Config: {e}")
 
 def run_batch_internal(config: ProjectConfig, files: Dict[str, bytes]):
-    results = []
-    global_tx_map = common_lib.build_global_transformer_map(files)
-    net_files = {k: v for k, v in files.items() if is_protection_file(k)}
-    
-    for fname, content in net_files.items():
-        dfs = db_converter.extract_data_from_db(content)
-        if not dfs: continue
-        topology_manager.resolve_all(config, dfs)
-        for plan in config.plans:
-            if "51" in plan.active_functions or "ANSI 51" in plan.active_functions:
-                try:
-                    res = ansi_51.calculate(plan, config, dfs, global_tx_map)
-                    results.append({"file": fname, "plan_id": plan.id, "status": "success", "data_51": res})
-                except Exception as e:
-                    results.append({"file": fname, "plan_id": plan.id, "status": "error", "error": str(e)})
-    return results
+    with WorkspaceContext(files, tables=common_lib.WORKSPACE_TABLES) as ctx:
+        global_tx_map = common_lib.build_global_transformer_map(ctx)
+        # [+] [INFO] Each file gets its own resolved copy of the config (no topology leaking between files)
+        return batch_engine.run_per_file(ctx, is_protection_file, run_function_for_file, config, global_tx_map, "51",
+                                         tables=common_lib.REQUIRED_TABLES)
+
+def run_workspace(path: str, require_files: bool = True):
+    files = load_workspace_files(path)
+    if require_files and not files: raise HTTPException(400, "Workspace empty")
+    config = get_config_from_files(files)
+    return run_batch_internal(config, files)
+
+def export_workspace(path: str, generate_excel) -> bytes:
+    """Calculation + Excel rendering in one analysis slot (no second admission once the results exist)."""
+    return generate_excel(run_workspace(path, require_files=False))
 
 @router.post("/run")
 async def run_ansi_51_only(include_data: bool = False, project_id: Optional[str] = Query(None), user = Depends(get_current_user), db: Session = Depends(get_db)):
     path = get_storage_path(user, project_id, db)
-    files = load_workspace_files(path)
-    if not files: raise HTTPException(400, "Workspace empty")
-    config = get_config_from_files(files)
-    final_results = run_batch_internal(config, files)
+    final_results = await analysis_limiter.run(run_workspace, path)
     return {"status": "success", "total_scenarios": len(final_results), "results": final_results}
 
 @router.get("/export")
 async def export_ansi_51(format: str = "xlsx", project_id: Optional[str] = Query(None), user = Depends(get_current_user), db: Session = Depends(get_db)):
     path = get_storage_path(user, project_id, db)
-    files = load_workspace_files(path)
-    config = get_config_from_files(files)
-    results = run_batch_internal(config, files)
     if format == "json":
+        results = await analysis_limiter.run(run_workspace, path, require_files=False)
         return JSONResponse({"results": results}, headers={"Content-Disposition": "attachment; filename=ansi_51.json"})
-    try:
-        excel_bytes = ansi_51.generate_excel(results)
-        return StreamingResponse(io.BytesIO(excel_bytes), media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", headers={"Content-Disposition": "attachment; filename=ansi_51.xlsx"})
-    except: return JSONResponse({"error": "Excel export not available"}, status_code=501)
+    # [decision:logic] Only a missing exporter (or its Excel engine) is "not available": a busy server (503)
+    # or a calculation error keeps its own status
+    generate_excel = getattr(ansi_51, "generate_excel", None)
+    if generate_excel is None: return JSONResponse({"error": "Excel export not available"}, status_code=501)
+    try: excel_bytes = await analysis_limiter.run(export_workspace, path, generate_excel)
+    except ImportError: return JSONResponse({"error": "Excel export not available"}, status_code=501)
+    return StreamingResponse(io.BytesIO(excel_bytes), media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", headers={"Content-Disposition": "attachment; filename=ansi_51.xlsx"})
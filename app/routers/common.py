@@ -1,17 +1,18 @@
 
 import os
 import json
-import copy
 from typing import Optional, Dict
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
 from app.core.security import get_current_token
 from app.schemas.protection import ProjectConfig
-from app.calculations import db_converter, topology_manager
+from app.calculations import batch_engine
+from app.calculations.workspace import WorkspaceContext
 from app.calculations.ansi_code import common as common_lib
 from app.calculations.file_utils import is_protection_file
 
+from ..core.analysis_limiter import analysis_limiter
 from ..database import get_db
 from ..auth import get_current_user, ProjectAccessChecker
 from ..guest_guard import check_guest_restrictions
@@ -57,27 +58,15 @@ def get_config_from_files(files: Dict[str, bytes]) -> ProjectConfig:
 @router.post("/run")
 async def run(include_data: bool = False, project_id: Optional[str] = Query(None), user = Depends(get_current_user), db: Session = Depends(get_db)):
     target_path = get_storage_path(user, project_id, db)
+    return await analysis_limiter.run(run_common_analysis, target_path, include_data)
+
+def run_common_analysis(target_path: str, include_data: bool = False) -> dict:
     files = load_workspace_files(target_path)
     if not files: raise HTTPException(400, "Workspace empty")
 
     config = get_config_from_files(files)
-    global_tx = common_lib.build_global_transformer_map(files)
-    results = []
-    
-    for fname, content in files.items():
-        if not is_protection_file(fname): continue
-        dfs = db_converter.extract_data_from_db(content)
-        if not dfs: continue
-        
-        fconfig = copy.deepcopy(config)
-        topology_manager.resolve_all(fconfig, dfs)
-        
-        for plan in fconfig.plans:
-            try:
-                data = common_lib.get_electrical_parameters(plan, fconfig, dfs, global_tx)
-                if not include_data:
-                    data.pop("raw_data_from", None); data.pop("raw_data_to", None)
-                results.append({"plan_id": plan.id, "file": fname, "common_data": data})
-            except Exception as e:
-                results.append({"plan_id": plan.id, "file": fname, "error": str(e)})
+    with WorkspaceContext(files, base_dir=target_path, tables=common_lib.WORKSPACE_TABLES) as ctx:
+        global_tx = common_lib.build_global_transformer_map(ctx)
+        results = batch_engine.run_per_file(ctx, is_protection_file, common_lib.file_parameters, config, global_tx, include_data,
+                                            tables=common_lib.REQUIRED_TABLES)
     return {"status": "success", "results": results}
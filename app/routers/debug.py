@@ -3,6 +3,8 @@ import os
 from fastapi import APIRouter, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from firebase_admin import auth
+from app.calculations import db_converter
+from app.core.analysis_limiter import analysis_limiter
 
 router = APIRouter()
 security = HTTPBearer()
@@ -24,3 +26,21 @@ def debug_who_am_i(creds: HTTPAuthorizationCredentials = Depends(security)):
         }
     except Exception as e:
         return {"error": f"Token invalid: {str(e)}"}
+
+@router.get("/db-loader")
+def debug_db_loader(creds: HTTPAuthorizationCredentials = Depends(security)):
+    """ [+] [INFO] Which SQLite loading path was used (cache / uri / deserialize / tempfile). """
+    try:
+        auth.verify_id_token(creds.credentials)
+    except Exception as e:
+        return {"error": f"Token invalid: {str(e)}"}
+    return db_converter.get_load_stats()
+
+@router.get("/analysis-limiter")
+def debug_analysis_limiter(creds: HTTPAuthorizationCredentials = Depends(security)):
+    """ [+] [INFO] Analyses currently admitted (running + queued) vs configured limits. """
+    try:
+        auth.verify_id_token(creds.credentials)
+    except Exception as e:
+        return {"error": f"Token invalid: {str(e)}"}
+    return analysis_limiter.stats()
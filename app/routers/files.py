@@ -2,17 +2,19 @@
 import os
 import shutil
 import zipfile
-import io
 import datetime
 import uuid
 from typing import List, Optional
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query, Body
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query, Body, Request
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from ..database import get_db
 from ..auth import get_current_user, QUOTAS
 from ..models import User
 from ..core.storage import get_target_path
+from ..core import uploads, zip_stream
+from app.calculations.file_utils import is_database_file
 
 router = APIRouter()
 
@@ -29,60 +31,180 @@ def count_files_recursive(directory: str) -> int:
     except: pass
     return total_files
 
-# --- ENDPOINTS ---
-
-@router.post("/upload")
-async def upload_files(files: List[UploadFile] = File(...), project_id: Optional[str] = Query(None), user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    target_dir = get_target_path(user, project_id, db, action="write")
-    
-    user_quota = QUOTAS.get(user.global_role, QUOTAS["guest"])
-    max_files = user_quota["max_files"]
-    
-    if max_files != -1 and count_files_recursive(target_dir) + len(files) > max_files:
+def _check_file_quota(user: User, target_dir: str, incoming: int):
+    max_files = QUOTAS.get(user.global_role, QUOTAS["guest"])["max_files"]
+    if max_files != -1 and count_files_recursive(target_dir) + incoming > max_files:
         msg = f"Quota exceeded. Limit: {max_files} files."
         if user.global_role == "guest": msg += " Create an account for more."
         elif user.global_role == "user": msg += " Upgrade to Nitro."
         raise HTTPException(status_code=403, detail=msg)
 
-    saved_files, count = [], 0
+def _cache_warmer():
+    """Parse-cache warmer for the study files of an archive (None if the calculation stack is unavailable)."""
+    try:
+        from app.calculations import db_converter, topology_setup, loadflow_calculator
+        from app.calculations.ansi_code import common as common_lib
+    except ImportError:
+        return None
+    tables = db_converter.merge_table_specs(topology_setup.REQUIRED_TABLES, loadflow_calculator.REQUIRED_TABLES, list(common_lib.WORKSPACE_TABLES))
+    def warm(path: str):
+        if is_database_file(path): db_converter.warm_cache(path, tables)
+    return warm
+
+def _store_upload(tmp_path: str, filename: str, target_dir: str, submission_id: str, user: User = None, warm_cache: bool = False):
+    """
+    Moves a fully received temp file (staging folder) to its final name in the workspace (atomic),
+    zip archives are extracted entry by entry within the user's quota. Returns (saved names, file count).
+    """
+    if filename.endswith(".zip"):
+        unzip_dir_name = os.path.splitext(filename)[0]
+        unzip_dir = os.path.join(target_dir, f"{unzip_dir_name}_{submission_id}")
+        
+        if os.path.exists(unzip_dir):
+            uploads.publish(tmp_path, os.path.join(target_dir, filename))
+            return [filename], 1
+        quota = QUOTAS.get(user.global_role, QUOTAS["guest"]) if user else {}
+        max_files = quota.get("max_files", -1)
+        files_left = None if max_files == -1 else max(0, max_files - count_files_recursive(target_dir))
+        os.makedirs(unzip_dir, exist_ok=True)
+        try:
+            count = uploads.extract_zip(tmp_path, unzip_dir, files_left, uploads.max_upload_bytes(quota),
+                                        on_file=_cache_warmer() if warm_cache else None)
+            os.remove(tmp_path)
+            return [f"{unzip_dir_name}_{submission_id}/"], count
+        except zipfile.BadZipFile:
+            shutil.rmtree(unzip_dir)
+            uploads.publish(tmp_path, os.path.join(target_dir, filename))
+            return [filename], 1
+        except BaseException:
+            # Quota breach or I/O error: no half-extracted folder is left behind
+            shutil.rmtree(unzip_dir, ignore_errors=True)
+            raise
+
+    file_path = os.path.join(target_dir, filename)
+    if os.path.exists(file_path):
+        base, ext = os.path.splitext(filename)
+        file_path = os.path.join(target_dir, f"{base}_{submission_id}{ext}")
+    uploads.publish(tmp_path, file_path)
+    if warm_cache:
+        warm = _cache_warmer()
+        if warm:
+            try: warm(file_path)
+            except Exception as e: print(f"[Upload] Post-processing failed for {filename}: {e}")
+    return [os.path.basename(file_path)], 1
+
+# --- ENDPOINTS ---
+
+@router.post("/upload")
+async def upload_files(
+    files: List[UploadFile] = File(...),
+    project_id: Optional[str] = Query(None),
+    warm_cache: bool = Query(False, description="Parse and cache the .si2s/.lf1s/.mdb files as they land (analyses start faster)."),
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    target_dir = get_target_path(user, project_id, db, action="write")
+    _check_file_quota(user, target_dir, len(files))
+    max_bytes = uploads.max_upload_bytes(QUOTAS.get(user.global_role, QUOTAS["guest"]))
+
+    saved_files, count, received = [], 0, []
     submission_id = str(uuid.uuid4())[:8]
     
     for file in files:
+        tmp = None
         try:
-            content = await file.read()
-            
-            if file.filename.endswith(".zip"):
-                unzip_dir_name = os.path.splitext(file.filename)[0]
-                unzip_dir = os.path.join(target_dir, f"{unzip_dir_name}_{submission_id}")
-                
-                if os.path.exists(unzip_dir):
-                    file_path = os.path.join(target_dir, file.filename)
-                    with open(file_path, "wb") as f: f.write(content)
-                    saved_files.append(file.filename); count += 1
-                else:
-                    os.makedirs(unzip_dir, exist_ok=True)
-                    try:
-                        with zipfile.ZipFile(io.BytesIO(content)) as z:
-                            z.extractall(unzip_dir)
-                            saved_files.append(f"{unzip_dir_name}_{submission_id}/")
-                            count += len(z.namelist())
-                    except zipfile.BadZipFile:
-                        shutil.rmtree(unzip_dir)
-                        file_path = os.path.join(target_dir, file.filename)
-                        with open(file_path, "wb") as f: f.write(content)
-                        saved_files.append(file.filename); count += 1
-            else:
-                file_path = os.path.join(target_dir, file.filename)
-                if os.path.exists(file_path):
-                    base, ext = os.path.splitext(file.filename)
-                    file_path = os.path.join(target_dir, f"{base}_{submission_id}{ext}")
-                
-                with open(file_path, "wb") as f: f.write(content)
-                saved_files.append(os.path.basename(file_path)); count += 1
+            # [+] [INFO] Copied in chunks to a temp file of the user's staging folder (limits and SHA-256 as bytes flow)
+            tmp = await uploads.stream_to_temp(uploads.iter_upload(file), user.firebase_uid, max_bytes)
+            names, n = await run_in_threadpool(_store_upload, tmp.path, file.filename, target_dir, submission_id, user, warm_cache)
+            saved_files.extend(names); count += n
+            received.append({"filename": file.filename, "size": tmp.size, "sha256": tmp.sha256})
+        except HTTPException:
+            if tmp: tmp.discard()
+            raise
         except Exception:
+            if tmp: tmp.discard()
             continue
             
-    return {"status": "success", "saved": saved_files, "count": count}
+    return {"status": "success", "saved": saved_files, "count": count, "files": received}
+
+# --- CHUNKED / RESUMABLE UPLOAD (large studies) ---
+
+@router.post("/upload/initiate")
+def initiate_upload(
+    filename: str = Body(...),
+    size: Optional[int] = Body(None),
+    sha256: Optional[str] = Body(None),
+    project_id: Optional[str] = Query(None),
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Opens an upload session. Parts are then sent with PUT /files/upload/{upload_id}/parts/{n} (n = 1, 2, ...)."""
+    target_dir = get_target_path(user, project_id, db, action="write")
+    name = os.path.basename(filename.replace("\\", "/"))
+    if not name or name.startswith("."):
+        raise HTTPException(status_code=400, detail="Invalid filename.")
+    _check_file_quota(user, target_dir, 1)
+    max_bytes = uploads.max_upload_bytes(QUOTAS.get(user.global_role, QUOTAS["guest"]))
+    if size is not None and max_bytes is not None and size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File too large. Limit: {max_bytes // (1024 * 1024)} MB per file.")
+
+    meta = uploads.create_session(target_dir, user.firebase_uid, name, size, sha256)
+    return {"upload_id": meta["upload_id"], "filename": name, "chunk_size": uploads.UPLOAD_CHUNK_SIZE}
+
+@router.put("/upload/{upload_id}/parts/{part}")
+async def upload_part(
+    upload_id: str,
+    part: int,
+    request: Request,
+    project_id: Optional[str] = Query(None),
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Raw request body = bytes of part `part`. Re-sending a part replaces it (resume after a failure)."""
+    target_dir = get_target_path(user, project_id, db, action="write")
+    meta = uploads.load_session(target_dir, upload_id, user.firebase_uid)
+    max_bytes = uploads.max_upload_bytes(QUOTAS.get(user.global_role, QUOTAS["guest"]))
+    return await uploads.store_part(meta, part, request.stream(), max_bytes)
+
+@router.get("/upload/{upload_id}")
+def upload_status(upload_id: str, project_id: Optional[str] = Query(None), user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Parts already received (a client resumes with the missing ones)."""
+    target_dir = get_target_path(user, project_id, db, action="write")
+    meta = uploads.load_session(target_dir, upload_id, user.firebase_uid)
+    parts = uploads.list_parts(user.firebase_uid, upload_id)
+    return {"upload_id": upload_id, "filename": meta["filename"], "size": meta.get("size"),
+            "received_bytes": sum(parts.values()), "parts": parts}
+
+@router.post("/upload/{upload_id}/complete")
+async def complete_upload(
+    upload_id: str,
+    project_id: Optional[str] = Query(None),
+    warm_cache: bool = Query(False, description="Parse and cache the study file(s) once published."),
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Assembles the parts, checks size / SHA-256 and publishes the file atomically."""
+    target_dir = get_target_path(user, project_id, db, action="write")
+    meta = uploads.load_session(target_dir, upload_id, user.firebase_uid)
+    _check_file_quota(user, target_dir, 1)
+    max_bytes = uploads.max_upload_bytes(QUOTAS.get(user.global_role, QUOTAS["guest"]))
+
+    assembled = await run_in_threadpool(uploads.assemble_session, meta, max_bytes)
+    submission_id = str(uuid.uuid4())[:8]
+    try:
+        names, count = await run_in_threadpool(_store_upload, assembled["path"], meta["filename"], target_dir, submission_id, user, warm_cache)
+    finally:
+        if os.path.exists(assembled["path"]): os.remove(assembled["path"])
+    uploads.drop_session(user.firebase_uid, upload_id)
+    return {"status": "success", "saved": names, "count": count,
+            "files": [{"filename": meta["filename"], "size": assembled["size"], "sha256": assembled["sha256"]}]}
+
+@router.delete("/upload/{upload_id}")
+def abort_upload(upload_id: str, project_id: Optional[str] = Query(None), user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    target_dir = get_target_path(user, project_id, db, action="write")
+    uploads.load_session(target_dir, upload_id, user.firebase_uid)
+    uploads.drop_session(user.firebase_uid, upload_id)
+    return {"status": "aborted", "upload_id": upload_id}
 
 @router.get("/details")
 def list_files(project_id: Optional[str] = Query(None), user = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -141,36 +263,37 @@ def list_files(project_id: Optional[str] = Query(None), user = Depends(get_curre
     files_info.sort(key=lambda x: x['path'])
     return {"files": files_info}
 
+def _download_entries(target_dir: str, filenames: List[str]):
+    """(path, arcname) of the requested files and folders, lazily (the walk runs while the zip streams)."""
+    for fname in filenames:
+        if ".." in fname: continue 
+        fpath = os.path.join(target_dir, fname)
+        if not os.path.abspath(fpath).startswith(os.path.abspath(target_dir)): continue
+        
+        if os.path.exists(fpath):
+            if os.path.isfile(fpath):
+                yield fpath, fname
+            else: # It's a directory
+                 for root, _, files in os.walk(fpath):
+                    for file in files:
+                        file_path = os.path.join(root, file)
+                        arc_path = os.path.relpath(file_path, fpath)
+                        yield file_path, os.path.join(fname, arc_path)
+
 @router.post("/download")
 def download(
     filenames: List[str], 
     project_id: Optional[str] = Query(None), 
+    store_only: bool = Query(False, description="No compression (content already compressed): faster, bigger archive."),
     user = Depends(get_current_user), 
     db: Session = Depends(get_db)
 ):
     target_dir = get_target_path(user, project_id, db, action="read")
-    zip_buffer = io.BytesIO()
-    
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for fname in filenames:
-            if ".." in fname: continue 
-            fpath = os.path.join(target_dir, fname)
-            if not os.path.abspath(fpath).startswith(os.path.abspath(target_dir)): continue
-            
-            if os.path.exists(fpath):
-                if os.path.isfile(fpath):
-                    zip_file.write(fpath, arcname=fname)
-                else: # It's a directory
-                     for root, _, files in os.walk(fpath):
-                        for file in files:
-                            file_path = os.path.join(root, file)
-                            arc_path = os.path.relpath(file_path, fpath)
-                            zip_file.write(file_path, arcname=os.path.join(fname, arc_path))
-
-    zip_buffer.seek(0)
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    # [+] [INFO] Chunked response (no Content-Length): bytes leave as each file is compressed,
+    # memory stays at one chunk whatever the project size.
     return StreamingResponse(
-        iter([zip_buffer.getvalue()]), 
+        zip_stream.stream_zip(_download_entries(target_dir, filenames), store_only=store_only),
         media_type="application/zip", 
         headers={"Content-Disposition": f"attachment; filename=solufuse_download_{timestamp}.zip"}
     )
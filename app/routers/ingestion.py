@@ -1,8 +1,7 @@
 
 import os
-import io
 import json
-import zipfile
+import itertools
 import pandas as pd
 from typing import Optional, List
 from fastapi import APIRouter, Depends, HTTPException, Query
@@ -12,7 +11,8 @@ from sqlalchemy.orm import Session
 from ..database import get_db
 from ..auth import get_current_user, ProjectAccessChecker
 from ..guest_guard import check_guest_restrictions
-from app.calculations import db_converter
+from app.calculations import db_converter, batch_engine
+from ..core import zip_stream
 
 router = APIRouter(prefix="/ingestion", tags=["Ingestion"])
 
@@ -39,16 +39,17 @@ def preview_data(filename: str = Query(...), project_id: Optional[str] = Query(N
     base_dir = get_ingestion_path(user, project_id, db)
     file_path = os.path.join(base_dir, filename)
     if not os.path.exists(file_path): raise HTTPException(404, "File not found")
-    try:
-        with open(file_path, "rb") as f: content = f.read()
-    except Exception as e: raise HTTPException(500, f"Read Error: {e}")
 
     data_to_return = {}
     if filename.lower().endswith('.json'):
+        try:
+            with open(file_path, "rb") as f: content = f.read()
+        except Exception as e: raise HTTPException(500, f"Read Error: {e}")
         try: data_to_return = json.loads(content)
         except: raise HTTPException(400, "Invalid JSON")
     elif is_db_file(filename):
-        dfs = db_converter.extract_data_from_db(content)
+        # [+] [INFO] Opened read-only in place (no tempfile, no full read in memory)
+        dfs = db_converter.extract_data_from_db(source_path=file_path)
         if not dfs: raise HTTPException(500, "Could not extract data from DB")
         data_to_return = {"filename": filename, "tables": {}}
         for t, df in dfs.items():
@@ -61,8 +62,7 @@ def download_single(format: str, filename: str = Query(...), project_id: Optiona
     base_dir = get_ingestion_path(user, project_id, db)
     file_path = os.path.join(base_dir, filename)
     if not os.path.exists(file_path): raise HTTPException(404, "File not found")
-    with open(file_path, "rb") as f: content = f.read()
-    dfs = db_converter.extract_data_from_db(content)
+    dfs = db_converter.extract_data_from_db(source_path=file_path)
     if not dfs: raise HTTPException(400, "Unreadable or Empty")
     clean_name = os.path.splitext(filename)[0]
     if format == "xlsx":
@@ -74,30 +74,26 @@ def download_single(format: str, filename: str = Query(...), project_id: Optiona
         return Response(content=json_str, media_type="application/json", headers={"Content-Disposition": f"attachment; filename={clean_name}.json"})
     raise HTTPException(400, "Invalid format")
 
+# [+] [INFO] Bulk conversions run in the batch process pool and each file is zipped and sent as soon as it is
+# converted: memory holds the conversions in flight (BATCH_WORKERS), not the whole project.
+def _export_zip(files: List[tuple], format: str, zip_name: str, error: str):
+    if format not in ("xlsx", "json"): raise HTTPException(400, error)
+    results = batch_engine.export_files(files, format)
+    # First conversion awaited before answering: "nothing convertible" is still a 400, not an empty zip
+    first = next(results, None)
+    if first is None: raise HTTPException(400, error)
+
+    def entries():
+        for fname, data in itertools.chain([first], results):
+            yield f"{os.path.splitext(fname)[0]}.{format}", data
+    return StreamingResponse(zip_stream.stream_zip_data(entries()), media_type="application/zip", headers={"Content-Disposition": f"attachment; filename={zip_name}"})
+
 @router.get("/download-all/{format}")
 def download_all_zip(format: str, project_id: Optional[str] = Query(None), user = Depends(get_current_user), db: Session = Depends(get_db)):
     base_dir = get_ingestion_path(user, project_id, db)
     if not os.path.exists(base_dir): raise HTTPException(404, "Storage not found")
-    zip_buffer = io.BytesIO()
-    count = 0
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as z:
-        for f in os.listdir(base_dir):
-            full_path = os.path.join(base_dir, f)
-            if os.path.isfile(full_path) and is_db_file(f):
-                try:
-                    with open(full_path, "rb") as file_obj: content = file_obj.read()
-                    dfs = db_converter.extract_data_from_db(content)
-                    if dfs:
-                        base = os.path.splitext(f)[0]
-                        if format == "xlsx": z.writestr(f"{base}.xlsx", db_converter.generate_excel_bytes(dfs).getvalue())
-                        elif format == "json":
-                            d = {t: df.where(pd.notnull(df), None).to_dict(orient="records") for t, df in dfs.items()}
-                            z.writestr(f"{base}.json", json.dumps(d, default=str, indent=2))
-                        count += 1
-                except: continue
-    if count == 0: raise HTTPException(400, "No convertible files found")
-    zip_buffer.seek(0)
-    return StreamingResponse(zip_buffer, media_type="application/zip", headers={"Content-Disposition": "attachment; filename=batch_export.zip"})
+    files = [(f, os.path.join(base_dir, f)) for f in os.listdir(base_dir) if os.path.isfile(os.path.join(base_dir, f)) and is_db_file(f)]
+    return _export_zip(files, format, "batch_export.zip", "No convertible files found")
 
 # [!] NEW ENDPOINT: Selective Bulk Conversion
 @router.post("/bulk-download/{format}")
@@ -111,35 +107,12 @@ def bulk_convert_download(
     base_dir = get_ingestion_path(user, project_id, db)
     if not os.path.exists(base_dir): raise HTTPException(404, "Storage not found")
     
-    zip_buffer = io.BytesIO()
-    count = 0
-    
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as z:
-        for fname in filenames:
-            if ".." in fname or "/" in fname: continue
-            if not is_db_file(fname): continue
-            
-            full_path = os.path.join(base_dir, fname)
-            if os.path.isfile(full_path):
-                try:
-                    with open(full_path, "rb") as file_obj: content = file_obj.read()
-                    dfs = db_converter.extract_data_from_db(content)
-                    if dfs:
-                        base = os.path.splitext(fname)[0]
-                        if format == "xlsx": 
-                            excel_bytes = db_converter.generate_excel_bytes(dfs).getvalue()
-                            z.writestr(f"{base}.xlsx", excel_bytes)
-                        elif format == "json":
-                            d = {t: df.where(pd.notnull(df), None).to_dict(orient="records") for t, df in dfs.items()}
-                            z.writestr(f"{base}.json", json.dumps(d, default=str, indent=2))
-                        count += 1
-                except Exception as e:
-                    print(f"Error converting {fname}: {e}")
-                    continue
-
-    if count == 0: 
-        raise HTTPException(400, "No convertible files selected or conversion failed.")
+    files = []
+    for fname in filenames:
+        if ".." in fname or "/" in fname: continue
+        if not is_db_file(fname): continue
         
-    zip_buffer.seek(0)
-    filename_zip = f"solufuse_converted_{format}.zip"
-    return StreamingResponse(zip_buffer, media_type="application/zip", headers={"Content-Disposition": f"attachment; filename={filename_zip}"})
+        full_path = os.path.join(base_dir, fname)
+        if os.path.isfile(full_path): files.append((fname, full_path))
+
+    return _export_zip(files, format, f"solufuse_converted_{format}.zip", "No convertible files selected or conversion failed.")
@@ -0,0 +1,123 @@
+import os
+from typing import Optional, List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from app.calculations.file_utils import is_loadflow_file, is_database_file, is_protection_file
+from ..core.job_queue import job_queue, register, job_to_dict
+from ..core.storage import get_target_path, save_json_result
+from ..database import get_db
+from ..auth import get_current_user, ProjectAccessChecker
+from ..models import Job
+from . import loadflow as loadflow_router
+from . import topology as topology_router
+from . import protection as protection_router
+
+router = APIRouter(prefix="/jobs", tags=["Background Jobs"])
+
+class TopologyJobPayload(BaseModel):
+    filenames: Optional[List[str]] = None # None = every database file of the workspace
+
+def _safe_basename(basename: str, default: str) -> str:
+    if len(basename) > 20:
+        raise HTTPException(400, "Basename too long (max 20 characters).")
+    return "".join([c for c in basename if c.isalnum() or c in ('-', '_')]) or default
+
+# --- RUNNERS (executed by the job queue, outside the request) ---
+
+@register("loadflow")
+def _run_loadflow_job(target_path: str, params: dict, progress):
+    progress.start(sorted(f for f in os.listdir(target_path) if is_loadflow_file(f)))
+    results = loadflow_router.run_loadflow_analysis(target_path, progress=progress)
+    return loadflow_router.save_loadflow_archive(target_path, params["basename"], results)
+
+@register("topology")
+def _run_topology_job(target_path: str, params: dict, progress):
+    names = params.get("filenames")
+    if names is None: names = sorted(f for f in os.listdir(target_path) if is_database_file(f))
+    files_to_process = {}
+    for fname in map(os.path.basename, names):
+        full_path = os.path.join(target_path, fname)
+        if os.path.isfile(full_path):
+            with open(full_path, "rb") as f: files_to_process[fname] = f.read()
+    if not files_to_process:
+        raise HTTPException(status_code=404, detail="None of the specified files were found.")
+    progress.start(list(files_to_process))
+    return topology_router._run_and_save_topology(params["basename"], files_to_process, target_path,
+                                                  params.get("analysis_types"), progress=progress)
+
+@register("protection")
+def _run_protection_job(target_path: str, params: dict, progress):
+    # [?] [THOUGHT] Protection is a workspace-wide calculation (merged tables): per-file states move together.
+    names = sorted(f for f in os.listdir(target_path) if is_protection_file(f))
+    progress.start(names)
+    for f in names: progress(f, "running")
+    results = protection_router.run_global_analysis(target_path)
+    for f in names: progress(f, "done")
+    return save_json_result(target_path, "protection_results", params["basename"], results)
+
+# --- ENDPOINTS ---
+
+def _submit(kind: str, target_path: str, user, project_id: Optional[str], params: dict, db: Session):
+    job = job_queue.submit(db, kind, target_path, user.firebase_uid, project_id, params)
+    return {"job_id": job.id, "status": job.status, "poll": f"/jobs/{job.id}"}
+
+@router.post("/loadflow")
+def submit_loadflow(basename: str = "lf_res", project_id: Optional[str] = Query(None), user = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Queues a loadflow run; the result is archived in 'loadflow_results'."""
+    params = {"basename": _safe_basename(basename, "result")}
+    target_path = loadflow_router.get_analysis_path(user, project_id, db, action="write")
+    return _submit("loadflow", target_path, user, project_id, params, db)
+
+@router.post("/topology")
+def submit_topology(
+    payload: Optional[TopologyJobPayload] = None,
+    basename: str = "topo_res_b",
+    project_id: Optional[str] = Query(None),
+    analysis_types: Optional[List[topology_router.ANALYSIS_TYPES]] = Query(None),
+    user = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Queues a topology analysis; the result is archived in 'topology_results'."""
+    params = {
+        "basename": _safe_basename(basename, "result"),
+        "filenames": payload.filenames if payload else None,
+        "analysis_types": analysis_types,
+    }
+    target_path = get_target_path(user, project_id, db, action="write")
+    return _submit("topology", target_path, user, project_id, params, db)
+
+@router.post("/protection")
+def submit_protection(basename: str = "prot_res", project_id: Optional[str] = Query(None), user = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Queues a global protection run; the result is archived in 'protection_results'."""
+    params = {"basename": _safe_basename(basename, "result")}
+    # Same workspace resolution as the synchronous /protection/run
+    target_path = protection_router.resolve_protection_path(user, project_id, db)
+    # [!] Unlike /protection/run, the job archives its result in the project: editors only
+    if project_id: ProjectAccessChecker(required_role="editor")(project_id, user, db)
+    return _submit("protection", target_path, user, project_id, params, db)
+
+def _get_job(job_id: str, user, db: Session) -> Job:
+    job = db.query(Job).filter(Job.id == job_id).first()
+    if not job: raise HTTPException(404, "Job not found")
+    if job.owner_uid != user.firebase_uid:
+        # Project jobs are visible to project members, session jobs only to their owner.
+        if not job.project_id: raise HTTPException(404, "Job not found")
+        ProjectAccessChecker(required_role="viewer")(job.project_id, user, db)
+    return job
+
+@router.get("/{job_id}")
+def get_job(job_id: str, user = Depends(get_current_user), db: Session = Depends(get_db)):
+    return job_to_dict(_get_job(job_id, user, db))
+
+@router.get("")
+def list_jobs(project_id: Optional[str] = Query(None), limit: int = 20, user = Depends(get_current_user), db: Session = Depends(get_db)):
+    query = db.query(Job)
+    if project_id:
+        ProjectAccessChecker(required_role="viewer")(project_id, user, db)
+        query = query.filter(Job.project_id == project_id)
+    else:
+        query = query.filter(Job.owner_uid == user.firebase_uid)
+    jobs = query.order_by(Job.created_at.desc()).limit(min(max(limit, 1), 100)).all()
+    return [job_to_dict(j) for j in jobs]
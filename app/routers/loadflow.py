@@ -1,12 +1,14 @@
 
 import os
 import json
-import datetime
 from typing import Optional, Dict
 from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
+from ..core.analysis_limiter import analysis_limiter
+from ..core.storage import save_json_result
 from ..database import get_db
 from ..auth import get_current_user, ProjectAccessChecker
 from ..guest_guard import check_guest_restrictions
@@ -63,15 +65,53 @@ def extract_settings(files: Dict[str, bytes]) -> LoadflowSettings:
         return LoadflowSettings(**settings_dict)
     except Exception as e: raise HTTPException(422, f"Invalid Config: {str(e)}")
 
-@router.post("/run")
-async def run(format: str = "json", project_id: Optional[str] = Query(None), user = Depends(get_current_user), db: Session = Depends(get_db)):
-    target_dir = get_analysis_path(user, project_id, db, action="read")
+def run_loadflow_analysis(target_dir: str, progress=None) -> dict:
     files_map = load_directory_content(target_dir)
     if not files_map: raise HTTPException(400, "Workspace is empty")
     settings = extract_settings(files_map)
-    try: return loadflow_calculator.analyze_loadflow(files_map, settings, only_winners=False)
+    try: return loadflow_calculator.analyze_loadflow(files_map, settings, only_winners=False, progress=progress)
     except Exception as e: raise HTTPException(500, f"Calculation Error: {str(e)}")
 
+def save_loadflow_archive(target_dir: str, safe_basename: str, results: dict) -> dict:
+    """Writes the results in the 'loadflow_results' subfolder with a timestamped filename."""
+    # [structure:storage] Isolate results in 'loadflow_results' to keep root clean
+    return save_json_result(target_dir, "loadflow_results", safe_basename, results)
+
+def run_and_save_loadflow(target_dir: str, safe_basename: str) -> dict:
+    """Analysis + archive in one analysis slot: a finished calculation is never lost to a busy limiter."""
+    return save_loadflow_archive(target_dir, safe_basename, run_loadflow_analysis(target_dir))
+
+@router.post("/run")
+async def run(format: str = "json", project_id: Optional[str] = Query(None), user = Depends(get_current_user), db: Session = Depends(get_db)):
+    target_dir = get_analysis_path(user, project_id, db, action="read")
+    # [+] [INFO] CPU-bound body runs in the analysis executor (the event loop stays free)
+    return await analysis_limiter.run(run_loadflow_analysis, target_dir)
+
+def iter_loadflow_events(target_dir: str):
+    """NDJSON lines for /run/stream (errors become a final 'error' event: the response has already started)."""
+    try:
+        files_map = load_directory_content(target_dir)
+        if not files_map: raise HTTPException(400, "Workspace is empty")
+        settings = extract_settings(files_map)
+        for event in loadflow_calculator.iter_loadflow(files_map, settings):
+            # Every file was already streamed: the summary only carries the winners
+            if event["event"] == "summary": event = {k: v for k, v in event.items() if k != "results"}
+            yield json.dumps(jsonable_encoder(event), default=str) + "\n"
+    except HTTPException as e:
+        yield json.dumps({"event": "error", "status_code": e.status_code, "detail": e.detail}) + "\n"
+    except Exception as e:
+        yield json.dumps({"event": "error", "status_code": 500, "detail": f"Calculation Error: {str(e)}"}) + "\n"
+
+@router.post("/run/stream")
+async def run_stream(project_id: Optional[str] = Query(None), user = Depends(get_current_user), db: Session = Depends(get_db)):
+    """
+    Same analysis as /run, streamed as NDJSON: one 'file' event per analyzed file, a 'champion' event
+    each time a (study_id, config) group changes champion, then a 'summary' event with the winners.
+    """
+    target_dir = get_analysis_path(user, project_id, db, action="read")
+    events = analysis_limiter.stream(iter_loadflow_events, target_dir)
+    return StreamingResponse(events, media_type="application/x-ndjson")
+
 @router.post("/run-and-save")
 async def run_save(basename: str = "lf_res", project_id: Optional[str] = Query(None), user = Depends(get_current_user), db: Session = Depends(get_db)):
     """
@@ -89,33 +129,5 @@ async def run_save(basename: str = "lf_res", project_id: Optional[str] = Query(N
     # 3. Get Base Directory (Project or Session)
     target_dir = get_analysis_path(user, project_id, db, action="write")
     
-    # 4. Load Files & Calculate
-    files_map = load_directory_content(target_dir)
-    if not files_map: raise HTTPException(400, "Workspace is empty")
-    
-    settings = extract_settings(files_map)
-    try: 
-        results = loadflow_calculator.analyze_loadflow(files_map, settings, only_winners=False)
-    except Exception as e: 
-        raise HTTPException(500, f"Calculation Error: {str(e)}")
-    
-    # 5. Archive Logic: Create folder and generate Timestamped filename
-    # [structure:storage] Isolate results in 'loadflow_results' to keep root clean
-    archive_dir = os.path.join(target_dir, "loadflow_results")
-    if not os.path.exists(archive_dir):
-        os.makedirs(archive_dir, exist_ok=True)
-
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{safe_basename}_{timestamp}.json"
-    output_path = os.path.join(archive_dir, filename)
-    
-    # 6. Save File
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(jsonable_encoder(results), f, indent=2, default=str)
-        
-    return {
-        "status": "saved", 
-        "folder": "loadflow_results",
-        "filename": filename,
-        "full_path": f"/loadflow_results/{filename}"
-    }
+    # 4. Load Files, Calculate & Archive in a timestamped file (analysis executor, one admission)
+    return await analysis_limiter.run(run_and_save_loadflow, target_dir, safe_basename)
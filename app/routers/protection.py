@@ -8,7 +8,8 @@ from sqlalchemy.orm import Session
 
 from app.core.security import get_current_token
 from app.schemas.protection import ProjectConfig
-from app.calculations import db_converter, topology_manager
+from app.calculations import topology_manager, db_converter
+from app.calculations.workspace import WorkspaceContext
 from app.calculations.ansi_code import AVAILABLE_ANSI_MODULES
 from app.calculations.ansi_code import common as common_lib
 from app.routers import ansi_51 as ansi_51_router
@@ -16,6 +17,7 @@ from app.routers import ansi_21 as ansi_21_router
 from app.routers import common as common_router
 from app.calculations.file_utils import is_protection_file
 
+from ..core.analysis_limiter import analysis_limiter
 from ..database import get_db
 from ..auth import get_current_user, ProjectAccessChecker
 from ..guest_guard import check_guest_restrictions
@@ -52,19 +54,19 @@ def load_workspace_files(path: str) -> Dict[str, bytes]:
             except: pass
     return files
 
-def extract_data_from_memory(files: Dict[str, bytes]) -> Dict[str, pd.DataFrame]:
+def extract_data_from_memory(ctx: WorkspaceContext) -> Dict[str, pd.DataFrame]:
     merged = {}
-    for f, content in files.items():
+    for f in ctx.files:
         if is_protection_file(f):
             try:
-                dfs = db_converter.extract_data_from_db(content)
+                dfs = ctx.get_tables(f)
                 if dfs:
                     for t, df in dfs.items():
                         if t not in merged: merged[t] = []
-                        df['SourceFilename'] = f 
-                        merged[t].append(df)
+                        # [!] assign() : the context frames are shared, do not mutate them
+                        merged[t].append(df.assign(SourceFilename=f))
             except: pass
-    final = {}
+    final = db_converter.TableDict() # memo() : bus index shared by every plan of the run
     for k, v in merged.items():
         try: final[k] = pd.concat(v, ignore_index=True)
         except: final[k] = v[0]
@@ -83,12 +85,17 @@ def load_config_from_files(files: Dict[str, bytes]) -> ProjectConfig:
 @router.post("/run")
 async def run_global(project_id: Optional[str] = Query(None), user = Depends(get_current_user), db: Session = Depends(get_db)):
     target_dir = resolve_protection_path(user, project_id, db)
+    # [+] [INFO] CPU-bound body runs in the analysis executor (the event loop stays free)
+    return await analysis_limiter.run(run_global_analysis, target_dir)
+
+def run_global_analysis(target_dir: str) -> dict:
     files = load_workspace_files(target_dir)
     if not files: raise HTTPException(400, "Workspace empty")
 
     config = load_config_from_files(files)
-    global_tx_map = common_lib.build_global_transformer_map(files)
-    dfs = extract_data_from_memory(files)
+    with WorkspaceContext(files, base_dir=target_dir, tables=common_lib.WORKSPACE_TABLES) as ctx:
+        global_tx_map = common_lib.build_global_transformer_map(ctx)
+        dfs = extract_data_from_memory(ctx)
     
     config_updated = topology_manager.resolve_all(config, dfs)
     
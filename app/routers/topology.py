@@ -1,18 +1,18 @@
 
 import os
 import json
-import datetime
+import gzip
 from typing import Optional, List, Literal, Dict
 from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
 from app.calculations import topology_setup, topology_graph
 from app.calculations.file_utils import is_database_file
+from ..core.analysis_limiter import analysis_limiter
 from ..database import get_db
 from ..auth import get_current_user
-from ..core.storage import get_target_path
+from ..core.storage import get_target_path, save_json_result
 from .common import load_workspace_files
 
 router = APIRouter(prefix="/topology", tags=["Topology Analysis"])
@@ -22,11 +22,12 @@ ANALYSIS_TYPES = Literal['incomer', 'bus', 'transformer', 'cable', 'coupling', '
 class FileListPayload(BaseModel):
     filenames: List[str]
 
-async def _run_and_save_topology(
+def _run_and_save_topology(
     basename: str,
     files_to_process: Dict[str, bytes],
     target_path: str,
-    analysis_types: Optional[List[ANALYSIS_TYPES]] = None
+    analysis_types: Optional[List[ANALYSIS_TYPES]] = None,
+    progress=None
 ):
     if len(basename) > 20:
         raise HTTPException(400, "Basename too long (max 20 characters).")
@@ -36,78 +37,61 @@ async def _run_and_save_topology(
 
     all_results = []
     for filename, content in files_to_process.items():
-        result = topology_setup.analyze_topology(content, filename)
+        if progress: progress(filename, "running")
+        result = topology_setup.analyze_topology_cached(content, filename)
+        if progress: progress(filename, "done" if result.get("status") == "success" else "failed")
         if result.get("status") == "success":
-            if analysis_types:
-                filtered_analysis = {key: val for key, val in result.items() if key.replace('_analysis', '') in analysis_types or key in ['status', 'message', 'topology']}
-                for atype in analysis_types:
-                    if f'{atype}_analysis' not in filtered_analysis:
-                        filtered_analysis[f'{atype}_analysis'] = []
-                all_results.append({"file": filename, "analysis": filtered_analysis})
-            else:
-                all_results.append({"file": filename, "analysis": result})
+            all_results.append({"file": filename, "analysis": topology_setup.filter_analysis(result, analysis_types)})
 
     if not all_results:
         raise HTTPException(status_code=404, detail="No topology data could be extracted from the provided files.")
 
     results_to_save = {"status": "success", "results": all_results}
-
-    archive_dir = os.path.join(target_path, "topology_results")
-    if not os.path.exists(archive_dir):
-        os.makedirs(archive_dir, exist_ok=True)
-
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_filename = f"{safe_basename}_{timestamp}.json"
-    output_path = os.path.join(archive_dir, output_filename)
-
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(jsonable_encoder(results_to_save), f, indent=2, default=str)
-
-    return {
-        "status": "saved",
-        "folder": "topology_results",
-        "filename": output_filename,
-        "full_path": f"/topology_results/{output_filename}"
-    }
-
-async def _build_and_save_diagrams(
+    return save_json_result(target_path, "topology_results", safe_basename, results_to_save)
+
+def _load_seed_diagrams(target_path: str, seed: str) -> Dict[str, dict]:
+    """{file: diagram} of a previous save in 'diagram_results' (used as layout seed)."""
+    seed_path = os.path.join(target_path, "diagram_results", os.path.basename(seed))
+    if not os.path.isfile(seed_path):
+        raise HTTPException(status_code=404, detail=f"Seed diagram '{seed}' not found in diagram_results.")
+    try:
+        opener = gzip.open if seed_path.endswith(".gz") else open
+        with opener(seed_path, "rt", encoding="utf-8") as f: saved = json.load(f)
+        return {entry["file"]: topology_graph.expand_diagram(entry["diagram"]) for entry in saved.get("results", [])}
+    except (ValueError, KeyError, TypeError, AttributeError, OSError):
+        raise HTTPException(status_code=400, detail=f"'{seed}' is not a saved diagram file.")
+
+def _build_and_save_diagrams(
     basename: str,
     files_to_process: Dict[str, bytes],
-    target_path: str
+    target_path: str,
+    seed: Optional[str] = None,
+    diagram_format: str = "full",
+    compress: bool = False
 ):
     if len(basename) > 20:
         raise HTTPException(400, "Basename too long (max 20 characters).")
     safe_basename = "".join([c for c in basename if c.isalnum() or c in ('-', '_')])
     if not safe_basename: safe_basename = "diagram_result"
 
+    seed_diagrams = _load_seed_diagrams(target_path, seed) if seed else {}
+    # [decision:logic] A revised study may be saved under a new name: a single-file seed applies to every file.
+    default_seed = next(iter(seed_diagrams.values())) if len(seed_diagrams) == 1 else None
+
     all_diagrams = []
     for filename, content in files_to_process.items():
-        analysis_result = topology_setup.analyze_topology(content, filename)
+        analysis_result = topology_setup.analyze_topology_cached(content, filename)
         if analysis_result.get("status") == "success":
-            diagram = topology_graph.build_diagram(analysis_result)
+            diagram = topology_graph.build_diagram(analysis_result, seed=seed_diagrams.get(filename, default_seed))
+            if diagram_format == "compact": diagram = topology_graph.compact_diagram(diagram)
             all_diagrams.append({"file": filename, "diagram": diagram})
 
     if not all_diagrams:
         raise HTTPException(status_code=404, detail="Could not generate any diagrams for the provided files.")
 
     results_to_save = {"status": "success", "results": all_diagrams}
-    archive_dir = os.path.join(target_path, "diagram_results")
-    if not os.path.exists(archive_dir):
-        os.makedirs(archive_dir, exist_ok=True)
-
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_filename = f"{safe_basename}_{timestamp}.json"
-    output_path = os.path.join(archive_dir, output_filename)
-
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(jsonable_encoder(results_to_save), f, indent=2, default=str)
-
-    return {
-        "status": "saved",
-        "folder": "diagram_results",
-        "filename": output_filename,
-        "full_path": f"/diagram_results/{output_filename}"
-    }
+    compact = diagram_format == "compact"
+    return save_json_result(target_path, "diagram_results", safe_basename, results_to_save, compact=compact, compress=compress)
 
 @router.post("/run-and-save/bulk", description="Run analysis on a list of files and save results.")
 async def run_save_topology_bulk(
@@ -127,7 +111,7 @@ async def run_save_topology_bulk(
     if not files_to_process:
         raise HTTPException(status_code=404, detail="None of the specified files were found.")
 
-    return await _run_and_save_topology(basename, files_to_process, target_path, analysis_types)
+    return await analysis_limiter.run(_run_and_save_topology, basename, files_to_process, target_path, analysis_types)
 
 @router.post("/analyze")
 async def analyze_topology_endpoint(
@@ -141,6 +125,14 @@ async def analyze_topology_endpoint(
     Analyzes project topology for all files, identifying key components.
     '''
     target_path = get_target_path(user, project_id, db, action="read")
+    # [+] [INFO] CPU-bound body runs in the analysis executor (the event loop stays free)
+    return await analysis_limiter.run(_analyze_workspace, target_path, file_type, analysis_types)
+
+def _analyze_workspace(
+    target_path: str,
+    file_type: str = 'all',
+    analysis_types: Optional[List[ANALYSIS_TYPES]] = None
+):
     files = load_workspace_files(target_path)
     if not files:
         raise HTTPException(status_code=404, detail="No files found in the workspace.")
@@ -156,17 +148,10 @@ async def analyze_topology_endpoint(
             continue
 
         processed_files_count += 1
-        result = topology_setup.analyze_topology(content, filename)
+        result = topology_setup.analyze_topology_cached(content, filename)
         
         if result.get("status") == "success":
-            if analysis_types:
-                filtered_analysis = {key: val for key, val in result.items() if key.replace('_analysis', '') in analysis_types or key in ['status', 'message', 'topology']}
-                for atype in analysis_types:
-                    if f'{atype}_analysis' not in filtered_analysis:
-                        filtered_analysis[f'{atype}_analysis'] = []
-                all_results.append({"file": filename, "analysis": filtered_analysis})
-            else:
-                all_results.append({"file": filename, "analysis": result})
+            all_results.append({"file": filename, "analysis": topology_setup.filter_analysis(result, analysis_types)})
 
     if processed_files_count == 0:
         raise HTTPException(status_code=404, detail=f"No files of type '{file_type}' found.")
@@ -180,6 +165,9 @@ async def save_diagrams(
     payload: FileListPayload,
     basename: str = "diag_res_b",
     project_id: Optional[str] = Query(None),
+    seed: Optional[str] = Query(None, description="Previous file of 'diagram_results': unchanged nodes keep their position."),
+    diagram_format: Literal['full', 'compact'] = Query('full', alias="format", description="'compact': numeric node ids, shared edge styles, no details (see /diagram/{file}/details/{node_id})."),
+    compress: bool = Query(False, alias="gzip", description="Save as .json.gz"),
     user=Depends(get_current_user), 
     db: Session = Depends(get_db)
 ):
@@ -190,4 +178,24 @@ async def save_diagrams(
     if not files_to_process:
         raise HTTPException(status_code=404, detail="None of the specified files were found.")
 
-    return await _build_and_save_diagrams(basename, files_to_process, target_path)
+    return await analysis_limiter.run(_build_and_save_diagrams, basename, files_to_process, target_path, seed, diagram_format, compress)
+
+@router.get("/diagram/{file}/details/{node_id}", description="Details (analysis row) of one diagram node, fetched lazily.")
+async def get_diagram_node_details(
+    file: str,
+    node_id: str,
+    project_id: Optional[str] = Query(None),
+    user=Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    target_path = get_target_path(user, project_id, db, action="read")
+    file_path = os.path.join(target_path, os.path.basename(file))
+    if not is_database_file(file) or not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail=f"File '{file}' not found.")
+    return await analysis_limiter.run(_node_details, file_path, node_id)
+
+def _node_details(file_path: str, node_id: str):
+    details = topology_graph.load_node_details(file_path, node_id)
+    if details is None:
+        raise HTTPException(status_code=404, detail=f"Node '{node_id}' not found in '{os.path.basename(file_path)}'.")
+    return {"file": os.path.basename(file_path), "node_id": node_id, "details": details}
@@ -1,5 +1,5 @@
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 from typing import List, Optional, Dict, Any
 
 class TimeDialConfig(BaseModel):
@@ -84,3 +84,23 @@ class ProjectConfig(BaseModel):
     transformers: List[TransformerConfig] = []
     links_data: List[LinkData] = []
     plans: List[ProtectionPlan] = []
+
+    # [+] [INFO] Name-indexed views, built on first lookup (first entry wins, like the former linear scans)
+    _transformers_by_name: Optional[Dict[str, TransformerConfig]] = PrivateAttr(default=None)
+    _links_by_id: Optional[Dict[str, LinkData]] = PrivateAttr(default=None)
+    # Values derived from this config by the calculators (e.g. HV transformer sum), see common.hv_transformer_sum
+    _derived: Dict[Any, Any] = PrivateAttr(default_factory=dict)
+
+    def get_transformer(self, name: Optional[str]) -> Optional[TransformerConfig]:
+        if self._transformers_by_name is None:
+            index = {}
+            for t in self.transformers: index.setdefault(t.name, t)
+            self._transformers_by_name = index
+        return self._transformers_by_name.get(name)
+
+    def get_link(self, link_id: Optional[str]) -> Optional[LinkData]:
+        if self._links_by_id is None:
+            index = {}
+            for l in self.links_data: index.setdefault(l.id, l)
+            self._links_by_id = index
+        return self._links_by_id.get(link_id)